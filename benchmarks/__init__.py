@@ -0,0 +1,10 @@
+"""
+Performance checks, run by hand from the project root against local
+stand-ins (standins.py), never the real services:
+
+    python -m benchmarks                  # all of them, see __main__.py for baselines
+    python -m benchmarks.import_time      # cold start
+    python -m benchmarks.pipeline         # DownloaderManager throughput
+    python -m benchmarks.spotify          # playlist resolution
+    python -m benchmarks.library_scan     # 50k-file library scan / index sync
+"""
@@ -0,0 +1,85 @@
+"""
+Runs every benchmark, each in its own process (so peak RSS is per
+benchmark), and compares the results with a saved baseline.
+
+    python -m benchmarks                                  # full sizes (50k-file library...)
+    python -m benchmarks --quick                          # small sizes, about a minute
+    python -m benchmarks --save benchmarks/baseline.json  # record a baseline
+    python -m benchmarks --compare benchmarks/baseline.json --tolerance 0.25
+
+With --compare, exits 1 when a metric got worse by more than the
+tolerance: run it before a deploy, on the machine the baseline was saved on.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from .report import regressions
+from .standins import ROOT
+
+# name -> (full arguments, --quick arguments)
+BENCHMARKS = {
+    'import_time': (['-n', '5'], ['-n', '2']),
+    'pipeline': (['--tracks', '100'], ['--tracks', '20']),
+    'spotify': (['--tracks', '500'], ['--tracks', '100']),
+    'library_scan': (['--files', '50000'], ['--files', '5000']),
+}
+
+
+def run_benchmark(name: str, args: list) -> dict:
+    out = subprocess.run([sys.executable, '-m', f'benchmarks.{name}', '--json', *args],
+                         cwd=ROOT, capture_output=True, text=True)
+    for line in reversed(out.stdout.splitlines()):
+        if line.startswith('{'):
+            result = json.loads(line)
+            if out.returncode:
+                result['failed_run'] = True
+            return result
+    raise RuntimeError(f"benchmark {name} gave no result:\n{out.stderr[-2000:]}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--quick', action='store_true', help="small sizes")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed worsening per metric (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = []
+    for name in args.names or BENCHMARKS:
+        print(f"Running {name}...", flush=True)
+        result = run_benchmark(name, BENCHMARKS[name][1 if args.quick else 0])
+        results.append(result)
+        for key, value in result.items():
+            if key != 'benchmark':
+                print(f"  {key:28} {round(value, 3) if isinstance(value, float) else value}")
+
+    if args.save:
+        with open(args.save, 'w', encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+    failed = [r['benchmark'] for r in results if r.get('failed_run')]
+    if failed:
+        print(f"\nFailed runs: {', '.join(failed)}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding="utf-8") as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.compare}: {len(found)} regression(s)")
+        for message in found:
+            print(f"  {message}")
+        if found:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
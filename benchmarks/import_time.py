@@ -0,0 +1,121 @@
+"""
+Cold start benchmark: how long `import web.app` takes in a fresh interpreter,
+which modules cost the most, and how long until a new server answers /ready
+(what main.py waits for before opening the UI).
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time -n 10 --top 15
+    python -m benchmarks.import_time --budget 0.8   # exit 1 when slower
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from .report import emit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Not allowed at startup: each one is imported on first use
+HEAVY_MODULES = ('yt_dlp', 'bs4', 'requests', 'imageio_ffmpeg', 'deemix', 'deezer', 'tkinter')
+
+_local_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def _python(code: str, *args) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def import_seconds(module: str = 'web.app') -> float:
+    """Time to import `module` in a fresh interpreter (interpreter startup excluded)."""
+    out = _python(f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)")
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str = 'web.app', top: int = 10) -> list:
+    """[(cumulative seconds, module name)] of the `top` slowest top-level imports, from -X importtime."""
+    out = _python(f"import {module}", '-X', 'importtime')
+    found = []
+    for line in out.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # Direct imports of the app and of its own packages only, not their internals
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            found.append((int(parts[1]) / 1e6, name.strip()))
+    return sorted(found, reverse=True)[:top]
+
+
+def loaded_heavy_modules(module: str = 'web.app') -> list:
+    out = _python(f"import sys, {module}; print(' '.join(sys.modules))")
+    loaded = set(out.stdout.split())
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def ready_seconds(timeout: float = 30) -> float:
+    """Process start until /ready answers, like main.py on launch."""
+    port = _free_port()
+    code = f"from web.app import app; from web.server import serve; serve(app, host='127.0.0.1', port={port})"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with _local_opener.open(f'http://127.0.0.1:{port}/ready', timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"server not ready after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time", description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5, help="fresh interpreters per measure")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports listed")
+    parser.add_argument('--budget', type=float, help="fail when the median time to /ready exceeds it (seconds)")
+    parser.add_argument('--json', action='store_true', help="one JSON line (for python -m benchmarks)")
+    args = parser.parse_args(argv)
+
+    imports = [import_seconds() for _ in range(args.runs)]
+    ready = [ready_seconds() for _ in range(args.runs)]
+    heavy = loaded_heavy_modules()
+    failed = bool(heavy) or bool(args.budget and statistics.median(ready) > args.budget)
+
+    if args.json:
+        emit('import_time', {
+            'import_s': statistics.median(imports),
+            'ready_s': statistics.median(ready),
+            'heavy_modules': heavy,
+        }, as_json=True)
+        return 1 if failed else 0
+
+    print(f"import web.app:  median {statistics.median(imports) * 1000:.0f} ms  (min {min(imports) * 1000:.0f}, max {max(imports) * 1000:.0f}, {args.runs} runs)")
+    print(f"start -> /ready: median {statistics.median(ready) * 1000:.0f} ms  (min {min(ready) * 1000:.0f}, max {max(ready) * 1000:.0f}, interpreter startup included)")
+
+    print(f"\nSlowest imports (cumulative):")
+    for seconds, name in slowest_imports(top=args.top):
+        print(f"  {seconds * 1000:7.1f} ms  {name}")
+
+    print(f"\nHeavy backends loaded at startup: {', '.join(heavy) if heavy else 'none'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
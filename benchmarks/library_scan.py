@@ -0,0 +1,76 @@
+"""
+Library scan latency on a synthetic tree (50k files by default):
+scan_library (the plain walk), a first LibraryIndex.sync (walk + tags of
+every file), a sync with nothing changed (what every refresh costs) and
+the first page of /api/library.
+
+    python -m benchmarks.library_scan
+    python -m benchmarks.library_scan --files 5000 --tag-workers 8
+    python -m benchmarks.library_scan --tree /tmp/lib   # reuse a tree between runs
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from .standins import make_library, peak_rss_mb
+from .report import emit
+
+
+def run(files: int = 50000, tag_workers: int = 4, tree: str = None) -> dict:
+    from web.library import LibraryIndex, scan_library
+
+    with tempfile.TemporaryDirectory(prefix="marto-bench-") as tmp:
+        root = tree or os.path.join(tmp, 'library')
+        start = time.perf_counter()
+        if not os.path.isdir(root):
+            make_library(root, files)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = len(scan_library(root))
+        walk_seconds = time.perf_counter() - start
+
+        index = LibraryIndex(os.path.join(tmp, 'library.db'), tag_workers=tag_workers)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            index.sync(root)
+            sync_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index.sync(root)
+            resync_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.page(root, limit=200)
+        page_seconds = time.perf_counter() - start
+
+    return {
+        'files': found,
+        'tag_workers': tag_workers,
+        'tree_build': build_seconds,
+        'scan_library_s': walk_seconds,
+        'index_sync_s': sync_seconds,
+        'index_resync_s': resync_seconds,
+        'first_page_s': page_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.library_scan", description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=50000, help="audio files in the synthetic library")
+    parser.add_argument('--tag-workers', type=int, default=4, help="LibraryIndex tag_workers")
+    parser.add_argument('--tree', help="library folder to use (created there when missing, else a temporary one)")
+    parser.add_argument('--json', action='store_true', help="one JSON line (for python -m benchmarks)")
+    args = parser.parse_args(argv)
+
+    result = run(args.files, args.tag_workers, args.tree)
+    emit('library_scan', result, args.json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Download pipeline throughput: DownloaderManager.process_tracks on direct
+audio URLs served by the local stand-in, through yt-dlp's generic
+extractor, format negotiation and the transcode pool (WAV -> FLAC by
+default, i.e. one ffmpeg encode per track).
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --tracks 100 --workers 8 --latency 0.05
+    python -m benchmarks.pipeline --format wav      # no encode: network + disk only
+
+Reports tracks/min, time to the first finished file and peak RSS of this
+process (ffmpeg's memory is not included: getrusage(RUSAGE_CHILDREN) keeps
+the size a child had when forked from here, not what ffmpeg used).
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .standins import STANDIN_HOST, UNLIMITED, StandInServer, peak_rss_mb
+from .report import emit
+
+
+def standin_downloader(keep_lossy: bool = True):
+    """SoundCloud's downloader (negotiated formats) accepting the stand-in's URLs."""
+    from downloader.soundcloud import SoundCloudDownloader
+
+    class StandInDownloader(SoundCloudDownloader):
+        def accept(self, query: str) -> bool:
+            return STANDIN_HOST in query
+
+    return StandInDownloader(keep_lossy=keep_lossy)
+
+
+def run(tracks: int = 50, seconds: float = 5.0, latency: float = 0.0, workers: int = 4,
+        postprocess_workers: int = None, format: str = 'flac', verbose: bool = False) -> dict:
+    from downloader.manager import DownloaderManager
+
+    with StandInServer(tracks=tracks, seconds=seconds, latency=latency) as server, \
+            tempfile.TemporaryDirectory(prefix="marto-bench-") as output_path:
+        manager = DownloaderManager(playlist_workers=workers, postprocess_workers=postprocess_workers,
+                                    dedup=False, rate_limit_settings=UNLIMITED)
+        manager.downloaders.insert(0, standin_downloader())
+
+        first_file = []
+        lock = threading.Lock()
+
+        def on_file(path):
+            with lock:
+                if not first_file:
+                    first_file.append(time.perf_counter())
+
+        manager.add_file_listener(on_file)
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+            start = time.perf_counter()
+            results = manager.process_tracks(server.audio_urls(), output_path, no_cover=True, format=format)
+            elapsed = time.perf_counter() - start
+
+        done = [r for r in results if r.get('status') == 'success']
+        errors = [r.get('message') for r in results if r.get('status') != 'success']
+        if errors:
+            print(f"{len(errors)} tracks failed, first error: {errors[0]}", file=sys.stderr)
+        written = sum(os.path.getsize(f) for r in done for f in r.get('files') or [] if os.path.isfile(f))
+
+        return {
+            'tracks': tracks,
+            'failed': len(errors),
+            'workers': workers,
+            'format': format,
+            'elapsed_s': elapsed,
+            'tracks_per_min': len(done) / elapsed * 60,
+            'time_to_first_file_s': first_file[0] - start if first_file else None,
+            'written_mb': written / (1024 * 1024),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pipeline", description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=50, help="tracks downloaded")
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of each test track (5 s = 430 KB of WAV)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the stand-in waits before each answer")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="tracks processed in parallel (playlist_workers)")
+    parser.add_argument('--postprocess-workers', type=int, help="ffmpeg workers (default: one per CPU)")
+    parser.add_argument('-f', '--format', default='flac', help="requested format (flac transcodes, wav is kept)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the downloaders' output")
+    parser.add_argument('--json', action='store_true', help="one JSON line (for python -m benchmarks)")
+    args = parser.parse_args(argv)
+
+    result = run(args.tracks, args.seconds, args.latency, args.workers, args.postprocess_workers, args.format, args.verbose)
+    emit('pipeline', result, args.json)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
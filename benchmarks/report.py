@@ -0,0 +1,46 @@
+"""
+Benchmark results: {'benchmark': name, metric: value, ...}, printed for
+people or as one JSON line for `python -m benchmarks` to collect, and
+compared against a saved baseline.
+"""
+import json
+
+# Metrics where bigger is better; every other metric is a time or a size
+HIGHER_IS_BETTER = ('_per_min', '_per_s')
+
+# Keys compared with the baseline: the others are inputs (tracks, workers...)
+# or counts that only describe the run
+RESULT_SUFFIXES = ('_s', '_seconds', '_mb') + HIGHER_IS_BETTER
+
+
+def emit(name: str, metrics: dict, as_json: bool = False):
+    result = dict(benchmark=name, **metrics)
+    if as_json:
+        print(json.dumps(result))
+        return
+    print(f"\n{name}")
+    for key, value in metrics.items():
+        print(f"  {key:28} {value if not isinstance(value, float) else round(value, 3)}")
+
+
+def regressions(results: list, baseline: list, tolerance: float = 0.2) -> list:
+    """
+    Messages for every metric (key ending in one of RESULT_SUFFIXES) more
+    than `tolerance` (0.2 = 20%) worse than in `baseline` (same benchmark
+    name, same metric). Metrics missing on either side are ignored.
+    """
+    before = {r['benchmark']: r for r in baseline}
+    found = []
+    for result in results:
+        old = before.get(result['benchmark'])
+        if not old:
+            continue
+        for key, value in result.items():
+            base = old.get(key)
+            if not key.endswith(RESULT_SUFFIXES) or not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            higher_better = key.endswith(HIGHER_IS_BETTER)
+            change = (value - base) / base
+            if (-change if higher_better else change) > tolerance:
+                found.append(f"{result['benchmark']}.{key}: {base:g} -> {value:g} ({change:+.0%})")
+    return found
@@ -0,0 +1,66 @@
+"""
+Spotify playlist resolution: SpotifyResolver.resolve_playlist against the
+local stand-in (playlist page + one page per track), with a fresh track
+cache, then again with the cache filled.
+
+    python -m benchmarks.spotify
+    python -m benchmarks.spotify --tracks 500 --latency 0.1 --workers 16
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from .standins import UNLIMITED, StandInServer, peak_rss_mb
+from .report import emit
+
+
+def run(tracks: int = 200, latency: float = 0.05, workers: int = 8) -> dict:
+    from downloader.ratelimit import rate_limits
+    from downloader.spotify_resolver import SpotifyResolver
+
+    rate_limits.configure(UNLIMITED)
+    with StandInServer(tracks=tracks, latency=latency) as server, \
+            tempfile.TemporaryDirectory(prefix="marto-bench-") as tmp, \
+            open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        resolver = SpotifyResolver(max_workers=workers, cache_path=os.path.join(tmp, 'spotify_tracks.json'))
+
+        start = time.perf_counter()
+        cold = resolver.resolve_playlist(server.playlist_url())
+        cold_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        warm = resolver.resolve_playlist(server.playlist_url())
+        warm_seconds = time.perf_counter() - start
+
+    return {
+        'tracks': tracks,
+        'resolved': len(cold['tracks']),
+        'stand_in_latency': latency,
+        'workers': workers,
+        'cold_seconds': cold_seconds,
+        'cold_tracks_per_s': len(cold['tracks']) / cold_seconds,
+        'cached_seconds': warm_seconds,
+        'cached_tracks_per_s': len(warm['tracks']) / warm_seconds,
+        'requests': server.requests,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.spotify", description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=200, help="tracks in the playlist")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the stand-in waits before each answer")
+    parser.add_argument('-j', '--workers', type=int, default=8, help="SpotifyResolver max_workers")
+    parser.add_argument('--json', action='store_true', help="one JSON line (for python -m benchmarks)")
+    args = parser.parse_args(argv)
+
+    result = run(args.tracks, args.latency, args.workers)
+    emit('spotify', result, args.json)
+    return 0 if result['resolved'] == result['tracks'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
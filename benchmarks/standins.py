@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the services the download pipeline talks to, so the
+benchmarks measure our code and not the internet:
+
+    StandInServer   HTTP server on 127.0.0.1 with
+                      /audio/<name>.wav       generated audio, downloaded by yt-dlp's generic extractor
+                      /playlist/<id>          Spotify-like playlist page (<h1> + /track/ links)
+                      /track/<id>             Spotify-like track page (<title>Song - Artist | Spotify</title>)
+    make_library    synthetic library tree (N audio files in album folders)
+"""
+import io
+import math
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource # Not on Windows
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+STANDIN_HOST = '127.0.0.1'
+
+# Stand-in traffic is only limited by the benchmark settings, not by the
+# per-host defaults meant for real services (see downloader.ratelimit)
+UNLIMITED = {STANDIN_HOST: {'rate': None, 'max_concurrency': 64}}
+
+
+def make_wav(seconds: float = 5.0, rate: int = 44100, frequency: float = 440.0) -> bytes:
+    """16-bit mono sine wave, as WAV bytes."""
+    frames = int(seconds * rate)
+    samples = struct.pack(f'<{frames}h', *(int(12000 * math.sin(2 * math.pi * frequency * i / rate)) for i in range(frames)))
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples)
+    return out.getvalue()
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # yt-dlp probes a file then drops the connection: expected, not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInServer:
+    """
+    Threaded HTTP server serving `tracks` audio files and a `tracks`-long
+    playlist. `latency` seconds are waited before each answer (network round trip).
+    Use as a context manager; `url(path)` gives absolute URLs.
+    """
+
+    def __init__(self, tracks: int = 50, seconds: float = 5.0, latency: float = 0.0):
+        self.tracks = tracks
+        self.latency = latency
+        self.audio = make_wav(seconds)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = _QuietHTTPServer((STANDIN_HOST, 0), self._handler())
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def url(self, path: str) -> str:
+        return f"http://{STANDIN_HOST}:{self.port}{path}"
+
+    def audio_urls(self) -> list:
+        return [self.url(f"/audio/track-{i:05d}.wav") for i in range(self.tracks)]
+
+    def playlist_url(self) -> str:
+        return self.url("/playlist/bench")
+
+    def _page(self, path: str):
+        """(status, content type, body) for a request path."""
+        if path.startswith('/audio/') and path.endswith('.wav'):
+            return 200, 'audio/wav', self.audio
+        if path.startswith('/playlist/'):
+            links = "".join(f'<a href="{self.url(f"/track/t{i:05d}")}">Track {i}</a>\n' for i in range(self.tracks))
+            return 200, 'text/html', f"<html><body><h1>Benchmark Playlist</h1>\n{links}</body></html>".encode()
+        if path.startswith('/track/'):
+            track_id = path.rsplit('/', 1)[-1]
+            return 200, 'text/html', f"<html><head><title>Song {track_id} - Stand-in Artist | Spotify</title></head></html>".encode()
+        return 404, 'text/plain', b"not found"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _answer(self, with_body: bool):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                status, content_type, body = server._page(self.path.split('?', 1)[0])
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._answer(True)
+
+            def do_HEAD(self):
+                self._answer(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def make_library(root: str, files: int = 50000, per_folder: int = 12, seconds: float = 0.1) -> str:
+    """
+    Creates `files` small WAV files under root/<Artist NNNN>/<Album NN>/, hard
+    links of one file where the filesystem allows it. Returns root.
+    """
+    template = os.path.join(root, '.template.wav')
+    os.makedirs(root, exist_ok=True)
+    with open(template, 'wb') as f:
+        f.write(make_wav(seconds))
+
+    for i in range(files):
+        folder = os.path.join(root, f"Artist {i // (per_folder * 10):04d}", f"Album {i // per_folder % 10:02d}")
+        if i % per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{i % per_folder + 1:02d} - Track {i:06d}.wav")
+        try:
+            os.link(template, path)
+        except OSError:
+            shutil.copyfile(template, path)
+    os.remove(template)
+    return root
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, in MB; None on Windows."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
@@ -7,7 +7,7 @@ source.include_exts = py,png,jpg,kv,atlas,html,css,js,txt,json
 version = 1.1
 
 # Dependencies
-requirements = python3,kivy,flask,requests,yt-dlp,mutagen,android,pyjnius,openssl,sqlite3,certifi,urllib3,beautifulsoup4,werkzeug,jinja2,markupsafe,brotli
+requirements = python3,kivy,flask,requests,yt-dlp,mutagen,android,pyjnius,openssl,sqlite3,certifi,urllib3,beautifulsoup4,werkzeug,jinja2,markupsafe,brotli,waitress
 
 # Permissions
 android.permissions = INTERNET,WRITE_EXTERNAL_STORAGE,READ_EXTERNAL_STORAGE,FOREGROUND_SERVICE
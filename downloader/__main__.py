@@ -0,0 +1,62 @@
+"""
+Headless batch downloader.
+
+    python -m downloader "Artist - Title" https://soundcloud.com/...
+    python -m downloader -i exports.txt -o ~/Music -j 8
+    cat exports.txt | python -m downloader -i -
+
+One JSON line per query goes to the report (default: one
+<output>/batch_report-<key>.jsonl per list of queries). Running the same
+list again skips the queries that already succeeded; stdin is read as it
+comes, so it gets a new report every run (give --report to resume it).
+"""
+import argparse
+import itertools
+import os
+import sys
+
+from .batch import read_queries, run_batch
+from .manager import DownloaderManager
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m downloader", description="Download many queries or URLs.")
+    parser.add_argument('queries', nargs='*', help="queries or URLs (in addition to --input)")
+    parser.add_argument('-i', '--input', help="file with one query/URL per line, '-' for stdin")
+    parser.add_argument('-o', '--output', default=os.path.join(os.getcwd(), "downloads"), help="output folder")
+    parser.add_argument('-f', '--format', default="flac", help="audio format (flac, mp3, wav...)")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="queries downloaded in parallel")
+    parser.add_argument('--no-cover', action='store_true', help="don't embed cover art")
+    parser.add_argument('--report', help="JSONL report path (default: <output>/batch_report-<key>.jsonl)")
+    args = parser.parse_args(argv)
+
+    if not args.queries and not args.input:
+        parser.error("give queries as arguments or with --input")
+
+    # A list when it is known upfront (its report is then keyed by its content)
+    queries = list(read_queries(args.queries))
+    if args.input == '-':
+        queries = itertools.chain(queries, read_queries(sys.stdin))
+    elif args.input:
+        with open(args.input, 'r', encoding="utf-8") as f:
+            queries += read_queries(f)
+
+    manager = DownloaderManager()
+    try:
+        summary = run_batch(
+            manager,
+            queries,
+            output_path=args.output,
+            workers=args.workers,
+            report_path=args.report,
+            no_cover=args.no_cover,
+            format=args.format,
+        )
+    finally:
+        # Lookups of the last seconds are still only in memory
+        manager.save_caches()
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
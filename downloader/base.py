@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 import os
 
+
+def sanitize_folder_name(name: str) -> str:
+    """Keeps only characters that are safe in a folder name on every platform."""
+    return "".join([c for c in name if c.isalpha() or c.isdigit() or c in " .-_()"]).strip()
+
 class BaseDownloader(ABC):
     """Abstract base class for all music downloaders."""
 
@@ -12,9 +17,10 @@ class BaseDownloader(ABC):
         pass
 
     @abstractmethod
-    def download(self, query: str, output_path: str = ".", no_cover: bool = False) -> dict:
+    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", progress_hook=None) -> dict:
         """
         Downloads the track(s) from the query to the output_path.
+        progress_hook is an optional yt-dlp style progress callback.
         Returns a dict with result info (status, files, etc.).
         """
         pass
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import metrics
+
+# Default report file in the output folder, one per batch (see report_path_for)
+REPORT_NAME = "batch_report-{key}.jsonl"
+
+
+def read_queries(lines):
+    """Yields queries/URLs from text lines, skipping blanks and '#' comments."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def report_path_for(output_path: str, queries=None, format: str = "flac") -> str:
+    """
+    Default report of a batch: named after its format and query list, so
+    running the same list again resumes it and other batches never share it.
+    Without a list (a stream read as it comes), a new report for every run.
+    """
+    if isinstance(queries, (list, tuple)):
+        key = hashlib.sha1(json.dumps([format, list(queries)]).encode('utf-8')).hexdigest()[:12]
+    else:
+        key = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:4]
+    return os.path.join(output_path, REPORT_NAME.format(key=key))
+
+
+def completed_queries(report_path: str) -> set:
+    """Queries already reported as successful in a previous run (for resuming)."""
+    done = set()
+    try:
+        with open(report_path, 'r', encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # Truncated last line after a crash
+                if entry.get('status') == 'success':
+                    done.add(entry.get('query'))
+    except OSError:
+        pass
+    return done
+
+
+def run_batch(manager, queries, output_path: str = ".", workers: int = 4, report_path: str = None,
+              no_cover: bool = False, format: str = "flac", progress_hook=None, on_result=None) -> dict:
+    """
+    Downloads every query with DownloaderManager.process on `workers` threads.
+
+    `queries` can be any iterable (e.g. lines of stdin); it is consumed as
+    workers free up rather than read upfront. One JSON line per query is
+    appended to report_path (default: see report_path_for), and queries
+    already successful in that report are skipped, so re-running the same
+    list (or passing the report of an interrupted stream) resumes it.
+    Returns {'status', 'title', 'report', 'total', 'success', 'failed', 'skipped'}.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    report_path = report_path or report_path_for(output_path, queries, format)
+    done = completed_queries(report_path)
+    counts = {'total': 0, 'success': 0, 'failed': 0, 'skipped': 0}
+    lock = threading.Lock()
+    # Never more than 2 queries per worker waiting in memory
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)
+
+    @metrics.bind # Worker threads add their spans to the job's trace
+    def run(query):
+        started = time.time()
+        try:
+            result = manager.process(query, output_path=output_path, no_cover=no_cover, format=format, progress_hook=progress_hook)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        result = result or {"status": "error", "message": "No result"}
+
+        entry = {
+            "query": query,
+            "status": result.get('status'),
+            "title": result.get('title'),
+            "files": result.get('files') or [],
+            "message": result.get('message'),
+            "cached": bool(result.get('cached')),
+            "elapsed": round(time.time() - started, 3),
+            "finished_at": time.time(),
+        }
+        with lock:
+            counts['success' if entry['status'] == 'success' else 'failed'] += 1
+            report.write(json.dumps(entry) + "\n")
+            report.flush()
+        if on_result:
+            on_result(entry)
+
+    def release(_future):
+        slots.release()
+
+    with open(report_path, 'a', encoding="utf-8") as report:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="marto-batch") as pool:
+            for query in queries:
+                with lock:
+                    counts['total'] += 1
+                    if query in done:
+                        counts['skipped'] += 1
+                        continue
+                    done.add(query) # Duplicated lines are only downloaded once
+                slots.acquire()
+                pool.submit(run, query).add_done_callback(release)
+
+    # Like playlists: the batch itself succeeds, failures are counted per query
+    title = f"Batch: {counts['success']} ok, {counts['failed']} failed, {counts['skipped']} skipped"
+    print(f"{title}. Report: {report_path}")
+    return dict(status="success", title=title, report=report_path, **counts)
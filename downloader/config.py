@@ -0,0 +1,21 @@
+import os
+import sys
+from pathlib import Path
+
+
+def get_project_root() -> Path:
+    """Folder next to the executable when frozen (PyInstaller), else the repo root."""
+    if getattr(sys, 'frozen', False):
+        return Path(os.path.dirname(sys.executable))
+    return Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_config_dir(*parts) -> Path:
+    """
+    Returns (and creates) a folder under <project root>/config for caches and
+    settings, or under MARTO_CONFIG_DIR when set (tests, several instances).
+    """
+    base = os.environ.get('MARTO_CONFIG_DIR')
+    folder = Path(base).joinpath(*parts) if base else get_project_root().joinpath('config', *parts)
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
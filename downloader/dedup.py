@@ -0,0 +1,196 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+
+# Names tried by DownloadCache.materialize: "title.ext", "title (2).ext"...
+MAX_NAME_ATTEMPTS = 50
+
+
+def normalize_query(query: str) -> str:
+    """Case/space/unicode-insensitive form of a search query or URL, used as cache key."""
+    return " ".join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    Makes dst have the content of src as cheaply as the filesystem allows:
+    hardlink, then reflink (copy-on-write clone, Linux), then a plain copy.
+    Returns the method used. dst must not exist (FileExistsError): an
+    existing file is never written to, it may be a hardlink of another one.
+    """
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+
+    # Clone/copy next to dst, then give it its name only if that is still free
+    fd, tmp_path = tempfile.mkstemp(prefix=".marto-", suffix=".tmp", dir=os.path.dirname(dst) or ".")
+    try:
+        with os.fdopen(fd, 'wb') as d, open(src, 'rb') as s:
+            try:
+                import fcntl
+                FICLONE = 0x40049409
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                method = "reflink"
+            except (ImportError, OSError):
+                shutil.copyfileobj(s, d, 1024 * 1024)
+                method = "copy"
+        _claim(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return method
+
+
+def _claim(tmp_path: str, dst: str):
+    """Renames tmp_path to dst, unless dst exists (FileExistsError)."""
+    try:
+        os.link(tmp_path, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # No hardlinks here (FAT, Android shared storage): check, then rename
+        if os.path.exists(dst):
+            raise FileExistsError(dst)
+        os.replace(tmp_path, dst)
+    else:
+        os.remove(tmp_path)
+
+
+def same_content(path: str, src: str, sha256: str = None) -> bool:
+    """Whether path holds the same bytes as src (sha256: src's, if known)."""
+    try:
+        if os.path.samefile(path, src):
+            return True
+        if os.path.getsize(path) != os.path.getsize(src):
+            return False
+        return file_sha256(path) == (sha256 or file_sha256(src))
+    except OSError:
+        return False
+
+
+class DownloadCache:
+    """
+    Persistent index of what was already downloaded:
+      queries: normalized query/URL (+ search route) -> source id ('Youtube:<id>', ...)
+      files:   (source id, requested format) -> stored file, size and sha256
+    so the same song requested again (other playlist, other wording of the
+    URL) is served from disk instead of being searched/downloaded again.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS queries (
+                    query_key TEXT PRIMARY KEY,
+                    source_id TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    source_id TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    title TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (source_id, format)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+            self._db.commit()
+
+    def source_for_query(self, query_key: str):
+        with self._lock:
+            row = self._db.execute("SELECT source_id FROM queries WHERE query_key = ?", (query_key,)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, source_id: str, format: str):
+        """
+        Returns {'path', 'title', 'sha256'} of a still valid stored file, or None.
+        Entries whose file vanished or changed size are dropped.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, size, sha256, title FROM files WHERE source_id = ? AND format = ?",
+                (source_id, format)
+            ).fetchone()
+        if not row:
+            return None
+        path, size, sha256, title = row
+        try:
+            if os.path.getsize(path) == size:
+                return {'path': path, 'title': title, 'sha256': sha256}
+        except OSError:
+            pass
+        self.forget(source_id, format)
+        return None
+
+    def forget(self, source_id: str, format: str):
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE source_id = ? AND format = ?", (source_id, format))
+            self._db.commit()
+
+    def remember(self, source_id: str, format: str, path: str, title: str = None, query_key: str = None):
+        """Records a finished download (hashing the file once)."""
+        try:
+            size = os.path.getsize(path)
+            sha256 = file_sha256(path)
+        except OSError as e:
+            print(f"Warning: not caching {path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (source_id, format, path, size, sha256, title, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source_id, format, os.path.abspath(path), size, sha256, title, now)
+            )
+            if query_key:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO queries (query_key, source_id, updated_at) VALUES (?, ?, ?)",
+                    (query_key, source_id, now)
+                )
+            self._db.commit()
+
+    def materialize(self, cached: dict, output_path: str) -> tuple:
+        """
+        Puts the cached file into output_path (no-op if it is already there).
+        A different file with the same name is left alone: the copy gets
+        the first free "name (2).ext" instead. Returns (path, method).
+        """
+        src = cached['path']
+        os.makedirs(output_path, exist_ok=True)
+        stem, ext = os.path.splitext(os.path.basename(src))
+        for n in range(1, MAX_NAME_ATTEMPTS + 1):
+            dst = os.path.join(output_path, f"{stem}{ext}" if n == 1 else f"{stem} ({n}){ext}")
+            if os.path.exists(dst):
+                if same_content(dst, src, cached.get('sha256')):
+                    return dst, "existing"
+                continue
+            try:
+                return dst, link_or_copy(src, dst)
+            except FileExistsError:
+                continue # Created meanwhile by another download
+        raise FileExistsError(f"No free name for {stem}{ext} in {output_path}")
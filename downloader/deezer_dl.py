@@ -1,73 +1,153 @@
-from .base import BaseDownloader
 import os
-import sys
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .base import BaseDownloader
+from .config import get_project_root, get_config_dir
+from .metrics import metrics
 
 # Deemix imports
-# We wrap them in try-except to avoid crashing if imports fail (though PyInstaller should bundle them)
-try:
-    from deezer import Deezer, TrackFormats
-    from deemix import generateDownloadObject
-    from deemix.settings import load as loadSettings
-    # from deemix.utils import getBitrateNumberFromText, formatListener
-    from deemix.downloader import Downloader
-    from deemix.itemgen import GenerationError
-    DEEMIX_AVAILABLE = True
-except ImportError:
-    DEEMIX_AVAILABLE = False
-
-class LogListener:
-    @classmethod
-    def send(cls, key, value=None):
-        # We can route this to our own logs if we want
-        pass
+# Loaded on the first Deezer download (the deemix stack is slow to import and
+# most sessions never use it). A failed import just disables Deezer.
+DEEMIX_AVAILABLE = None
+
+def load_deemix() -> bool:
+    """Imports deemix / deezer-py once; False if they are not installed."""
+    global DEEMIX_AVAILABLE, Deezer, TrackFormats, generateDownloadObject, loadSettings, Downloader
+    if DEEMIX_AVAILABLE is None:
+        try:
+            from deezer import Deezer, TrackFormats
+            from deemix import generateDownloadObject
+            from deemix.settings import load as loadSettings
+            # from deemix.utils import getBitrateNumberFromText, formatListener
+            from deemix.downloader import Downloader
+            DEEMIX_AVAILABLE = True
+        except ImportError:
+            DEEMIX_AVAILABLE = False
+    return DEEMIX_AVAILABLE
+
+class FileListener:
+    """
+    deemix event listener: collects the path of every track deemix reports
+    as downloaded and forwards it as a yt-dlp style 'finished' progress event.
+    """
+
+    def __init__(self, progress_hook=None):
+        self.files = []
+        self.progress_hook = progress_hook
+        self._lock = threading.Lock()
+
+    def send(self, key, value=None):
+        # Other events (downloadInfo, startDownload...) could be routed to our logs
+        if key != 'updateQueue' or not isinstance(value, dict):
+            return
+        path = value.get('downloadPath')
+        if not value.get('downloaded') or not path:
+            return
+        with self._lock:
+            if path in self.files:
+                return
+            self.files.append(path)
+        if self.progress_hook:
+            title = os.path.splitext(os.path.basename(path))[0]
+            self.progress_hook({'status': 'finished', 'filename': path, 'info_dict': {'id': path, 'title': title}})
+
+class DeezerSession:
+    """
+    Logged-in Deezer client and deemix settings shared by every download.
+    The ARL login happens once; the session is checked again every
+    `check_interval` seconds (and after a failed request) and logs in anew
+    when Deezer dropped it. deezer-py's client is a requests session, safe
+    to use from several threads once logged in.
+    """
+
+    def __init__(self, check_interval: float = 600):
+        self.config_folder = get_config_dir('deemix')
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._dz = None
+        self._settings = None
+        self._checked_at = 0
+
+    def _arls(self):
+        # Saved token first, then arl.txt next to the app (easier for user)
+        for arl_file in (self.config_folder / '.arl', get_project_root() / 'arl.txt'):
+            if arl_file.is_file():
+                with open(arl_file, 'r', encoding="utf-8") as f:
+                    yield arl_file, f.readline().strip()
+
+    def _login(self):
+        for arl_file, arl in self._arls():
+            dz = Deezer()
+            if arl and dz.login_via_arl(arl):
+                saved = self.config_folder / '.arl'
+                if arl_file != saved:
+                    # Save valid arl to config for future
+                    with open(saved, 'w', encoding="utf-8") as f:
+                        f.write(arl)
+                return dz
+        return None
+
+    @staticmethod
+    def _logged_in(dz) -> bool:
+        try:
+            user_data = dz.gw.get_user_data()
+            return bool(user_data) and user_data["USER"]["USER_ID"] != 0
+        except Exception:
+            return False
+
+    def client(self, check: bool = False):
+        """The logged-in Deezer client, or None if no ARL works. check=True forces a session check."""
+        with self._lock:
+            now = time.time()
+            if self._dz is not None and (check or now - self._checked_at > self.check_interval):
+                if not self._logged_in(self._dz):
+                    print("Deezer session expired, logging in again...")
+                    self._dz = None
+                self._checked_at = now
+            if self._dz is None:
+                self._dz = self._login()
+                self._checked_at = now
+            return self._dz
+
+    def settings(self) -> dict:
+        """Copy of the deemix settings (config/deemix), read from disk once."""
+        with self._lock:
+            if self._settings is None:
+                self._settings = loadSettings(self.config_folder)
+            return dict(self._settings)
+
 
 class DeezerDownloader(BaseDownloader):
+    def __init__(self, object_workers: int = 3):
+        """
+        object_workers: download objects (albums of an artist, ...) downloaded at
+        the same time; deemix already fetches the tracks of each one in parallel
+        (queueConcurrency in config/deemix).
+        """
+        self.object_workers = max(1, object_workers)
+        self.session = DeezerSession()
+
     def accept(self, query: str) -> bool:
         return "deezer.com" in query
 
-    def download(self, query: str, output_path: str = ".", no_cover: bool = False) -> dict:
-        if not DEEMIX_AVAILABLE:
+    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", progress_hook=None) -> dict:
+        if not load_deemix():
             return {"status": "error", "message": "Deemix library not found. Please reinstall."}
             
         print(f"Downloading from Deezer via Library: {query}")
         
-        # 1. Setup Config Paths
-        if getattr(sys, 'frozen', False):
-            project_root = Path(os.path.dirname(sys.executable))
-        else:
-            project_root = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            
-        config_folder = project_root / 'config' / 'deemix'
-        config_folder.mkdir(parents=True, exist_ok=True)
-        
-        # 2. Setup ARL
-        arl_file = config_folder / '.arl'
-        arl = ""
-        if arl_file.is_file():
-            with open(arl_file, 'r', encoding="utf-8") as f:
-                arl = f.readline().strip()
-        
-        dz = Deezer()
-        if not arl or not dz.login_via_arl(arl):
-            # Try to look for arl.txt in root (easier for user)
-            simple_arl = project_root / 'arl.txt'
-            if simple_arl.is_file():
-                 with open(simple_arl, 'r', encoding="utf-8") as f:
-                    arl = f.readline().strip()
-            
-            if not arl or not dz.login_via_arl(arl):
-                return {
-                    "status": "error", 
-                    "message": "Deezer Login Failed. Please create an 'arl.txt' file with your ARL token next to the app."
-                }
-            
-            # Save valid arl to config for future
-            with open(arl_file, 'w', encoding="utf-8") as f:
-                f.write(arl)
+        # 1. Login once per process (re-done only when the session expires)
+        dz = self.session.client()
+        if dz is None:
+            return {
+                "status": "error", 
+                "message": "Deezer Login Failed. Please create an 'arl.txt' file with your ARL token next to the app."
+            }
                 
-        # 3. Setup Settings
-        settings = loadSettings(config_folder)
+        # 2. Setup Settings (per call copy of the cached ones)
+        settings = self.session.settings()
         settings['downloadLocation'] = output_path
         settings['tracknameTemplate'] = '%artist% - %title%'
         settings['albumTracknameTemplate'] = '%artist% - %title%'
@@ -90,17 +170,28 @@ class DeezerDownloader(BaseDownloader):
         bitrate = TrackFormats.FLAC
         # settings['maxBitrate'] = ... logic in deemix uses passing bitrate to generateDownloadObject
         
-        # 4. Process Download
+        # 3. Process Download
         links = [query]
         downloadObjects = []
-        listener = LogListener()
+        listener = FileListener(progress_hook)
         plugins = {} # Spotify plugins etc, we skip for now
         
         for link in links:
             try:
                 # generateDownloadObject(dz, link, bitrate, plugins, listener)
                 # bitrate enum: MP3_128, MP3_320, FLAC
-                obj = generateDownloadObject(dz, link, bitrate, plugins, listener)
+                try:
+                    with metrics.span('resolve', host='deezer.com'):
+                        obj = generateDownloadObject(dz, link, bitrate, plugins, listener)
+                except Exception:
+                    # Maybe the session expired: retry once with a fresh login
+                    fresh = self.session.client(check=True)
+                    if fresh is None or fresh is dz:
+                        raise
+                    dz = fresh
+                    metrics.inc('marto_retries_total', help="Operations tried again", reason='deezer_relogin')
+                    with metrics.span('resolve', host='deezer.com'):
+                        obj = generateDownloadObject(dz, link, bitrate, plugins, listener)
                 if isinstance(obj, list):
                     downloadObjects += obj
                 else:
@@ -109,25 +200,26 @@ class DeezerDownloader(BaseDownloader):
                 print(f"Error generating object: {e}")
                 return {"status": "error", "message": f"Invalid Deezer link or error: {str(e)}"}
 
-        files_downloaded = []
-        
-        # 5. Start Download
-        for obj in downloadObjects:
-            try:
-                # Downloader(dz, obj, settings, listener).start()
-                # This is blocking? Yes, usually threads are used in GUI but here we can block.
-                # start() executes download.
-                downloader = Downloader(dz, obj, settings, listener)
-                downloader.start()
-                
-                # Collect filenames?
-                # Deemix doesn't return path easily. 
-                # We assume success if no exception.
-            except Exception as e:
-                return {"status": "error", "message": f"Download failed: {str(e)}"}
+        # 4. Start Download: objects in parallel, each one blocking until its tracks are done
+        @metrics.bind
+        def start(obj):
+            with metrics.span('download', host='deezer.com'):
+                Downloader(dz, obj, settings, listener).start()
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=min(self.object_workers, max(1, len(downloadObjects))), thread_name_prefix="marto-deezer") as pool:
+            for future in [pool.submit(start, obj) for obj in downloadObjects]:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+
+        if errors and len(errors) == len(downloadObjects):
+            return {"status": "error", "message": f"Download failed: {errors[0]}"}
 
         return {
             "status": "success", 
             "title": "Deezer Download", 
-            "files": [] # We can't easily list files
+            "files": listener.files, # Reported by deemix as each track is written
+            "failed": len(errors)
         }
@@ -0,0 +1,74 @@
+import itertools
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+    """Events for one listener (e.g. one /events connection), in publish order."""
+
+    def __init__(self, bus, size: int):
+        self._bus = bus
+        self._queue = queue.Queue(maxsize=size)
+
+    def _put(self, item):
+        # A listener that can't keep up loses its oldest events, downloads never wait for it
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None):
+        """Next (id, event, data), or None after `timeout` seconds without events."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._bus._unsubscribe(self)
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for the UI: job states, track progress and
+    files added to the library. The last `replay` events are kept so a client
+    reconnecting with the id of the last event it saw misses nothing.
+    """
+
+    def __init__(self, replay: int = 200, queue_size: int = 500):
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._recent = deque(maxlen=replay)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: str, data: dict) -> int:
+        with self._lock:
+            item = (next(self._ids), event, data)
+            self._recent.append(item)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._put(item)
+        return item[0]
+
+    def subscribe(self, last_id: int = None) -> Subscription:
+        """New Subscription; with last_id, the kept events published after it come first."""
+        subscription = Subscription(self, self.queue_size)
+        with self._lock:
+            if last_id is not None:
+                for item in self._recent:
+                    if item[0] > last_id:
+                        subscription._put(item)
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
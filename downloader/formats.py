@@ -0,0 +1,98 @@
+"""
+Format negotiation: pick the source stream closest to the requested format
+and decide the cheapest post-processing that delivers it.
+
+    keep       the file already is the requested codec and container
+    remux      same codec, other container: stream copy, no encode
+    keep-lossy lossy source asked as FLAC: re-encoding adds no quality, the
+               source codec is kept (stream copied into its usual container)
+    transcode  anything else: decode + encode with ffmpeg
+"""
+
+# Requested format -> codec of the file it produces
+TARGET_CODECS = {
+    'flac': 'flac',
+    'alac': 'alac',
+    'wav': 'pcm',
+    'mp3': 'mp3',
+    'm4a': 'aac',
+    'aac': 'aac',
+    'opus': 'opus',
+    'vorbis': 'vorbis',
+}
+
+# yt-dlp acodec values (prefix) -> codec
+SOURCE_CODECS = (
+    ('mp4a', 'aac'),
+    ('aac', 'aac'),
+    ('mp3', 'mp3'),
+    ('opus', 'opus'),
+    ('vorbis', 'vorbis'),
+    ('flac', 'flac'),
+    ('alac', 'alac'),
+    ('pcm', 'pcm'),
+)
+
+# Used when the extractor doesn't report acodec
+EXT_CODECS = {
+    'mp3': 'mp3',
+    'm4a': 'aac',
+    'aac': 'aac',
+    'opus': 'opus',
+    'ogg': 'vorbis',
+    'flac': 'flac',
+    'wav': 'pcm',
+}
+
+LOSSLESS_CODECS = ('flac', 'alac', 'pcm')
+
+# Lossless targets that exist to save space/archive: a lossy source is kept
+# as is rather than inflated. WAV is left out: it is asked for raw PCM.
+KEEP_LOSSY_TARGETS = ('flac', 'alac')
+
+
+def source_codec(acodec: str = None, ext: str = None) -> str:
+    acodec = (acodec or '').lower()
+    if acodec and acodec != 'none':
+        for prefix, codec in SOURCE_CODECS:
+            if acodec.startswith(prefix):
+                return codec
+    return EXT_CODECS.get((ext or '').lower())
+
+
+def format_selector(target: str) -> str:
+    """yt-dlp format string preferring streams already in the target codec."""
+    codec = TARGET_CODECS.get(target)
+    if codec is None:
+        return 'bestaudio/best'
+    choices = [f'bestaudio[ext={target}]'] if target in EXT_CODECS else []
+    choices.append(f'bestaudio[acodec^={"mp4a" if codec == "aac" else codec}]')
+    if codec in LOSSLESS_CODECS:
+        # Any lossless stream converts to any other without loss
+        choices += [f'bestaudio[acodec^={c}]' for c in LOSSLESS_CODECS if c != codec]
+    choices += ['bestaudio', 'best']
+    return '/'.join(choices)
+
+
+def negotiate(target: str, acodec: str = None, ext: str = None, keep_lossy: bool = True) -> dict:
+    """
+    Decides how to turn a downloaded file (acodec/ext as reported by yt-dlp)
+    into `target`. Returns {'action', 'reason', 'source_codec', 'source_ext',
+    'target', 'preferredcodec'}; preferredcodec is the FFmpegExtractAudio
+    setting, None when no audio post-processor is needed.
+    """
+    codec = source_codec(acodec, ext)
+    wanted = TARGET_CODECS.get(target)
+    decision = {'source_codec': codec, 'source_ext': ext, 'target': target}
+
+    if codec and codec == wanted and ext == target:
+        action, reason, preferred = 'keep', 'already in the requested format', None
+    elif codec and codec == wanted:
+        action, reason, preferred = 'remux', f'{codec} stream copied from .{ext}', target
+    elif codec and codec not in LOSSLESS_CODECS and keep_lossy and target in KEEP_LOSSY_TARGETS:
+        action, reason, preferred = 'keep-lossy', f'{codec} source, {target} would not add quality', 'best'
+    else:
+        action, reason, preferred = 'transcode', f'{codec or "unknown"} -> {wanted or target}', target
+
+    decision.update(action=action, reason=reason, preferredcodec=preferred)
+    return decision
@@ -0,0 +1,317 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .batch import report_path_for, run_batch
+from .metrics import metrics, Trace
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+    pass
+
+
+# Progress of a track is reported to on_progress at most this often (seconds),
+# state changes (finished, error) always are
+PROGRESS_INTERVAL = 0.5
+
+# A journaled job started this many times without finishing (the process
+# died each time, maybe because of the job itself) is not resumed again
+MAX_RESUME_ATTEMPTS = 3
+
+
+class Job:
+    """
+    One call to DownloaderManager.process running in the background.
+    Tracks overall state plus per-track progress fed by yt-dlp progress hooks.
+    on_progress(job, key, track), if set, is called with throttled track updates.
+    """
+
+    def __init__(self, query: str, output_path: str, options: dict, kind: str = "download", payload: dict = None, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind # "download" (one query) or "batch" (list of queries)
+        self.query = query
+        self.output_path = output_path
+        self.options = options
+        self.payload = payload # Extra arguments of batch jobs (queries, workers, report)
+        self.resumed = False
+        self.state = "queued"  # queued -> running -> success | error
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.tracks = OrderedDict()
+        self.trace = None # metrics.Trace of the run, when the queue keeps traces
+        self.on_progress = None
+        self._reported = {} # track key -> (state, time) last given to on_progress
+        self._lock = threading.Lock()
+
+    def progress_hook(self, d: dict):
+        """
+        yt-dlp progress hook. Called from the download thread with the
+        standard yt-dlp status dict (status, downloaded_bytes, total_bytes, eta...).
+        """
+        info = d.get('info_dict') or {}
+        key = info.get('id') or d.get('filename') or info.get('title')
+        if not key:
+            return
+
+        with self._lock:
+            track = self.tracks.get(key)
+            if track is None:
+                track = {
+                    'title': info.get('title'),
+                    'state': 'downloading',
+                    'downloaded_bytes': 0,
+                    'total_bytes': None,
+                    'speed': None,
+                    'eta': None,
+                }
+                self.tracks[key] = track
+
+            status = d.get('status')
+            track['downloaded_bytes'] = d.get('downloaded_bytes') or track['downloaded_bytes']
+            track['total_bytes'] = d.get('total_bytes') or d.get('total_bytes_estimate') or track['total_bytes']
+
+            if status == 'downloading':
+                track['state'] = 'downloading'
+                track['speed'] = d.get('speed')
+                track['eta'] = d.get('eta')
+            elif status == 'finished':
+                track['state'] = 'finished'
+                track['downloaded_bytes'] = track['total_bytes'] or track['downloaded_bytes']
+                track['speed'] = None
+                track['eta'] = 0
+            elif status == 'error':
+                track['state'] = 'error'
+
+            # Decide under the lock, call outside of it
+            now = time.time()
+            last_state, last_time = self._reported.get(key, (None, 0))
+            report = self.on_progress is not None and (track['state'] != last_state or now - last_time >= PROGRESS_INTERVAL)
+            if report:
+                self._reported[key] = (track['state'], now)
+                track = dict(track)
+
+        if report:
+            self.on_progress(self, key, track)
+
+    def start(self):
+        with self._lock:
+            self.state = "running"
+            self.started_at = time.time()
+
+    def finish(self, result: dict):
+        with self._lock:
+            self.result = result
+            self.state = "success" if result and result.get('status') == 'success' else "error"
+            self.finished_at = time.time()
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("success", "error")
+
+    def to_dict(self, include_tracks: bool = True) -> dict:
+        """State of the job; include_tracks=False leaves the per-track list out (smaller events)."""
+        with self._lock:
+            tracks = [dict(t) for t in self.tracks.values()]
+            data = {
+                "id": self.id,
+                "kind": self.kind,
+                "query": self.query,
+                "state": self.state,
+                "resumed": self.resumed,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "downloaded_bytes": sum(t['downloaded_bytes'] or 0 for t in tracks),
+                "tracks": tracks,
+                "result": self.result,
+            }
+            if not include_tracks:
+                del data['tracks']
+            return data
+
+
+class JobQueue:
+    """
+    Runs DownloaderManager.process calls on a bounded pool of worker threads
+    so the web server can answer immediately with a job id.
+    With a JobJournal, jobs and finished tracks are persisted and
+    resume_unfinished() restarts what a previous run left behind.
+    With an EventBus, job state changes ('job') and track progress
+    ('progress') are published as they happen.
+    With a trace_dir, the timing spans of each job (see metrics.Trace) are
+    written to <trace_dir>/<job id>.json when it finishes.
+    """
+
+    def __init__(self, manager, max_workers: int = 2, max_pending: int = 500, history: int = 200, journal=None, events=None,
+                 trace_dir: str = None):
+        self.manager = manager
+        self.journal = journal
+        self.events = events
+        self.trace_dir = trace_dir
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="marto-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, query: str, output_path: str = ".", **options) -> Job:
+        return self._enqueue(Job(query, output_path, options))
+
+    def submit_batch(self, queries: list, output_path: str = ".", workers: int = 4, report_path: str = None, **options) -> Job:
+        """Queues a whole list of queries as one job (see batch.run_batch)."""
+        queries = list(queries)
+        # Chosen now and journaled, so a resumed job continues the same report
+        report_path = report_path or report_path_for(output_path, queries, options.get('format', "flac"))
+        payload = {'queries': queries, 'workers': workers, 'report_path': report_path}
+        job = Job(f"batch ({len(payload['queries'])} queries)", output_path, options, kind="batch", payload=payload)
+        return self._enqueue(job)
+
+    def resume_unfinished(self) -> list:
+        """
+        Re-queues the jobs the journal still lists as queued/running (the
+        process stopped before they finished). They keep their id; tracks
+        that already succeeded are skipped and partial files are continued.
+        Jobs already started MAX_RESUME_ATTEMPTS times are marked as errors instead.
+        """
+        if self.journal is None:
+            return []
+        resumed = []
+        for row in self.journal.unfinished():
+            job = Job(row['query'], row['output_path'], row['options'], kind=row['kind'], payload=row['payload'], job_id=row['id'])
+            job.created_at = row['created_at']
+            if row['attempts'] >= MAX_RESUME_ATTEMPTS:
+                self._give_up(job, row['attempts'])
+                continue
+            job.resumed = True
+            print(f"Resuming job {job.id}: {job.query}")
+            try:
+                resumed.append(self._enqueue(job))
+            except QueueFullError as e:
+                print(f"Warning: could not resume job {job.id}: {e}")
+        return resumed
+
+    def _give_up(self, job: Job, attempts: int):
+        print(f"Not resuming job {job.id} ({job.query}): interrupted {attempts} times")
+        job.finish({"status": "error", "message": f"Gave up after {attempts} interrupted attempts"})
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self.journal.finish(job.id, job.state, job.result)
+        except Exception as e:
+            print(f"Warning: could not journal job {job.id}: {e}")
+        self._publish(job)
+
+    def _work(self, job: Job):
+        """Calls the manager for `job` and returns its result dict."""
+        on_track = None
+        if self.journal is not None:
+            on_track = lambda result: self.journal.track_done(job.id, result.get('query'), result)
+
+        if job.kind == "batch":
+            # The batch report already skips the queries done before a restart
+            return run_batch(
+                self.manager, job.payload['queries'],
+                output_path=job.output_path,
+                workers=job.payload.get('workers', 4),
+                report_path=job.payload.get('report_path'),
+                progress_hook=job.progress_hook,
+                on_result=on_track,
+                **job.options
+            )
+
+        finished_tracks = self.journal.finished_tracks(job.id) if job.resumed else None
+        return self.manager.process(
+            job.query,
+            output_path=job.output_path,
+            progress_hook=job.progress_hook,
+            on_track=on_track,
+            finished_tracks=finished_tracks,
+            **job.options
+        )
+
+    def _enqueue(self, job: Job) -> Job:
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if not j.done)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Too many pending jobs ({pending})")
+            self._jobs[job.id] = job
+            self._prune()
+        if self.journal is not None:
+            self.journal.add(job)
+        if self.events is not None:
+            job.on_progress = self._publish_progress
+        self._publish(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _publish(self, job: Job):
+        if self.events is not None:
+            self.events.publish('job', job.to_dict(include_tracks=False))
+
+    def _publish_progress(self, job: Job, key: str, track: dict):
+        self.events.publish('progress', {'job_id': job.id, 'key': key, 'track': track})
+
+    def _run(self, job: Job):
+        job.start()
+        self._publish(job)
+        if self.journal is not None:
+            self.journal.start(job.id)
+        if self.trace_dir:
+            job.trace = Trace(job.id)
+        try:
+            with metrics.tracing(job.trace), metrics.span('job', kind=job.kind):
+                result = self._work(job)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        job.finish(result)
+        metrics.inc('marto_jobs_total', help="Finished jobs", kind=job.kind, state=job.state)
+        if job.trace is not None:
+            self._save_trace(job)
+        if self.journal is not None:
+            try:
+                self.journal.finish(job.id, job.state, result)
+            except Exception as e:
+                print(f"Warning: could not journal job {job.id}: {e}")
+        self._publish(job)
+
+    def trace_path(self, job_id: str):
+        """Path of the saved trace of a finished job, or None."""
+        if not self.trace_dir or not job_id.isalnum():
+            return None
+        path = os.path.join(self.trace_dir, f"{job_id}.json")
+        return path if os.path.isfile(path) else None
+
+    def _save_trace(self, job: Job):
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            job.trace.save(os.path.join(self.trace_dir, f"{job.id}.json"))
+            # Keep as many traces as jobs in the history
+            traces = sorted((entry for entry in os.scandir(self.trace_dir) if entry.name.endswith('.json')),
+                            key=lambda entry: entry.stat().st_mtime)
+            for entry in traces[:max(0, len(traces) - self.history)]:
+                os.remove(entry.path)
+        except OSError as e:
+            print(f"Warning: could not save trace of job {job.id}: {e}")
+
+    def _prune(self):
+        # Forget the oldest finished jobs once we keep more than `history`
+        finished = [job_id for job_id, j in self._jobs.items() if j.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,128 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class JobJournal:
+    """
+    On-disk record of background jobs and of each finished track, so a job
+    interrupted by a crash (or Android killing the app) can be restarted
+    where it stopped instead of from track 1.
+
+      jobs:   id, kind, query, output folder, options, state, result,
+              attempts (times the job was started)
+      tracks: (job id, track query) -> state and result
+
+    Every change is committed right away (SQLite WAL), so the journal is
+    consistent whenever the process dies.
+    """
+
+    def __init__(self, db_path: str, history: int = 200):
+        self.db_path = db_path
+        self.history = history
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    payload TEXT,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    result TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Journals written before attempts were counted
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+            if 'attempts' not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    job_id TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    result TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, query)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+            self._db.commit()
+
+    def add(self, job):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, query, output_path, options, payload, state, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.query, job.output_path, json.dumps(job.options),
+                 json.dumps(job.payload) if job.payload is not None else None, job.state, job.created_at)
+            )
+            self._db.commit()
+
+    def start(self, job_id: str) -> int:
+        """Marks a job running and returns how many times it was started, this one included."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1 WHERE id = ?", (job_id,))
+            self._db.commit()
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def finish(self, job_id: str, state: str, result: dict):
+        """Marks a job done and drops its per-track rows (no longer needed to resume)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, result = ? WHERE id = ?",
+                (state, time.time(), json.dumps(result, default=str), job_id)
+            )
+            self._db.execute("DELETE FROM tracks WHERE job_id = ?", (job_id,))
+            # Keep only the most recent finished jobs
+            self._db.execute("""
+                DELETE FROM jobs WHERE finished_at IS NOT NULL AND id NOT IN (
+                    SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?
+                )
+            """, (self.history,))
+            self._db.commit()
+
+    def track_done(self, job_id: str, query: str, result: dict):
+        """Records the outcome of one track of a playlist/batch job."""
+        state = "success" if result.get('status') == 'success' else "error"
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks (job_id, query, state, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, query, state, json.dumps(result, default=str), time.time())
+            )
+            self._db.commit()
+
+    def finished_tracks(self, job_id: str) -> dict:
+        """Track query -> result for the tracks of job_id that already succeeded."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT query, result FROM tracks WHERE job_id = ? AND state = 'success'", (job_id,)
+            ).fetchall()
+        return {query: json.loads(result) for query, result in rows}
+
+    def unfinished(self) -> list:
+        """Jobs that were queued or running when the process stopped, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, query, output_path, options, payload, created_at, attempts FROM jobs "
+                "WHERE finished_at IS NULL ORDER BY created_at"
+            ).fetchall()
+        return [{
+            'id': row[0],
+            'kind': row[1],
+            'query': row[2],
+            'output_path': row[3],
+            'options': json.loads(row[4]),
+            'payload': json.loads(row[5]) if row[5] else None,
+            'created_at': row[6],
+            'attempts': row[7],
+        } for row in rows]
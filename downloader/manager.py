@@ -1,86 +1,173 @@
 import os
-from .soundcloud import SoundCloudDownloader
-from .youtube import YouTubeDownloader
-from .spotify_resolver import SpotifyResolver
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from .transcode import set_transcode_workers
+from .base import sanitize_folder_name
+from .config import get_config_dir
+from .dedup import DownloadCache, normalize_query
+from .search_cache import SearchCache
+from .ratelimit import rate_limits, load_rate_limits
+from .metrics import metrics
+
+# Default seconds a SoundCloud search gets before the YouTube lookup starts alongside (race_search)
+RACE_DELAY = 1.5
+
+# _resolve_search answer of a lookup called off before it reached the network
+CANCELLED = object()
+
+
+def _count_wasted_lookup(future):
+    # Raced lookup of a query the other provider answered: unless it was
+    # called off in time, its answer only ends up in the search cache
+    if not future.cancelled() and future.result() is not CANCELLED:
+        metrics.inc('marto_wasted_lookups_total', help="Raced lookups whose answer went unused", provider='yt')
 
-from .deezer_dl import DeezerDownloader
 
 class DownloaderManager:
-    def __init__(self):
-        self.downloaders = [
-            SoundCloudDownloader(),
-            YouTubeDownloader(),
-            DeezerDownloader()
-        ]
-
-    def process(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac") -> dict:
-        # Handle 'Sa Daronne' format (Random Mom Image)
-        if format == "daronne":
-            return self.download_daronne(query, output_path)
+    def __init__(self, playlist_workers: int = 4, postprocess_workers: int = None, dedup: bool = True, race_search: bool = True,
+                 rate_limit_settings: dict = None, keep_lossy: bool = True, race_delay: float = RACE_DELAY):
+        """
+        playlist_workers: tracks of a Spotify playlist searched/downloaded in parallel (1 = sequential).
+        postprocess_workers: threads running the ffmpeg post-processors, shared by all downloads
+            (default: one per CPU). Network downloads never wait for them.
+        dedup: reuse files already downloaded for the same query/source (config/downloads.db).
+        race_search: run the YouTube lookup of a free-text query concurrently with the
+            SoundCloud one instead of after a SoundCloud miss.
+        race_delay: seconds SoundCloud gets alone before YouTube starts too (0: both at
+            once). A hedge: most searches are answered by SoundCloud quickly, so the
+            YouTube request is only spent on the slow ones.
+        rate_limit_settings: per-host limits (see ratelimit.DEFAULT_RATE_LIMITS),
+            default: config/rate_limits.json merged over the defaults.
+        keep_lossy: when FLAC is requested and SoundCloud only has a lossy stream,
+            keep that stream instead of re-encoding it (see formats.negotiate).
+        """
+        self.playlist_workers = max(1, playlist_workers)
+        self.race_search = race_search
+        self.race_delay = max(0.0, race_delay)
+        # Raced lookups: up to two (SoundCloud + YouTube) per track searched in parallel
+        self._search_pool = ThreadPoolExecutor(max_workers=2 * self.playlist_workers, thread_name_prefix="marto-search")
+        set_transcode_workers(postprocess_workers)
+        if rate_limit_settings is None:
+            rate_limit_settings = load_rate_limits(str(get_config_dir() / 'rate_limits.json'))
+        rate_limits.configure(rate_limit_settings)
+        self.download_cache = DownloadCache(str(get_config_dir() / 'downloads.db')) if dedup else None
+        # Query -> chosen track URL, so repeated searches skip the extractor
+        self.search_cache = SearchCache(str(get_config_dir() / 'search_cache.json'))
+        # Called with the path of every file a download produced (e.g. library indexing)
+        self.file_listeners = []
+        self.keep_lossy = keep_lossy
+        # Backends (yt-dlp, requests/bs4, deemix) are imported on first use, not
+        # at startup: importing them is most of the app's cold start on phones
+        self._backends_lock = threading.Lock()
+        self._spotify = None
+        self._downloaders = None
 
-        # Check for Spotify
-        spotify = SpotifyResolver()
-        if spotify.accept(query):
-             print("Spotify URL detected...")
-             
-             if spotify.is_playlist(query):
-                 print("Playlist detected. Fetching tracks...")
-                 playlist_data = spotify.resolve_playlist(query)
-                 pl_title = playlist_data.get('title', 'Unknown Playlist').replace("|", "").strip() # Clean title
-                 tracks = playlist_data.get('tracks', [])
-                 
-                 print(f"Found playlist: '{pl_title}' with {len(tracks)} tracks.")
-                 
-                 # Create playlist sub-directory
-                 # Sanitize folder name
-                 safe_title = "".join([c for c in pl_title if c.isalpha() or c.isdigit() or c in " .-_()"]).strip()
-                 playlist_path = os.path.join(output_path, safe_title)
-                 os.makedirs(playlist_path, exist_ok=True)
-                 
-                 print(f"Downloading to: {playlist_path}")
-                 
-                 results = []
-                 for i, track_name in enumerate(tracks):
-                     print(f"[{i+1}/{len(tracks)}] Processing: {track_name}")
-                     # Recursive call for the track
-                     # We treat the track_name as a search query
-                     # FORCE YOUTUBE for Spotify results to avoid Remixes/Covers common on SC
-                     res = self.process(track_name, output_path=playlist_path, no_cover=no_cover, format=format, force_youtube=True)
-                     results.append(res)
-                     
-                 return {"status": "success", "title": pl_title, "files": [r.get('files') for r in results], "is_playlist": True}
+    @property
+    def spotify(self):
+        # Kept for the manager's lifetime so its HTTP session and track cache are reused
+        with self._backends_lock:
+            if self._spotify is None:
+                from .spotify_resolver import SpotifyResolver
+                self._spotify = SpotifyResolver()
+            return self._spotify
 
-             else:
-                 # Single track
-                 print("Resolving metadata...")
-                 resolved = spotify.resolve(query)
-                 if resolved:
-                     print(f"Resolved to: {resolved}")
-                     query = resolved # Treat as search query now
-                     # Force YouTube for single tracks too as they come from Spotify
-                     return self.process(query, output_path=output_path, no_cover=no_cover, format=format, force_youtube=True)
-                 else:
-                     return {"status": "error", "message": "Could not resolve Spotify URL"}
+    @property
+    def downloaders(self) -> list:
+        with self._backends_lock:
+            if self._downloaders is None:
+                from .soundcloud import SoundCloudDownloader
+                from .youtube import YouTubeDownloader
+                from .deezer_dl import DeezerDownloader
+                self._downloaders = [
+                    SoundCloudDownloader(keep_lossy=self.keep_lossy),
+                    YouTubeDownloader(),
+                    DeezerDownloader()
+                ]
+            return self._downloaders
 
-        # Check if it's a specific URL (SoundCloud/YouTube)
-        for downloader in self.downloaders:
-            if downloader.accept(query):
-                return downloader.download(query, output_path, no_cover=no_cover, format=format)
-        
-        # Internal args handling for recursion
-        force_youtube = False
-        # If this method was called with keyword arguments in kwargs (python trick, but here we defined it explicitly? No wait)
-        # I added force_youtube param to the call in lines 48 above, but I need to add it to the definition.
-        # Python doesn't support 'hidden' args easily without **kwargs.
-        # Let's change definition to include defaults or **kwargs?
-        # Actually I can just modify the signature above.
-        
-        pass
+    @property
+    def backends_loaded(self) -> bool:
+        return self._spotify is not None and self._downloaders is not None
+
+    def warm_up(self):
+        """Imports the backends now (e.g. in the background once the UI is up) so the first download doesn't wait for them."""
+        self.spotify
+        self.downloaders
+
+    def save_caches(self):
+        """
+        Writes the search and Spotify caches now. The search cache saves on a
+        daemon timer, so call this before the process exits (e.g. the CLI).
+        """
+        self.search_cache.save()
+        if self._spotify is not None:
+            self._spotify.cache.save()
+
+    def add_file_listener(self, callback):
+        """Registers callback(path) to be called for each downloaded file."""
+        self.file_listeners.append(callback)
+
+    def _notify_files(self, result: dict) -> dict:
+        metrics.inc('marto_downloads_total', help="Queries downloaded (playlist tracks one by one)",
+                    status=(result or {}).get('status') or 'error')
+        if result and result.get('status') == 'success':
+            for path in result.get('files') or []:
+                for callback in self.file_listeners:
+                    try:
+                        callback(path)
+                    except Exception as e:
+                        print(f"Warning: file listener failed for {path}: {e}")
+        return result
+
+    def process_tracks(self, tracks, output_path: str, no_cover: bool = False, format: str = "flac", progress_hook=None,
+                       on_track=None, finished_tracks=None) -> list:
+        """
+        Downloads search queries (e.g. resolved Spotify tracks) using up to
+        playlist_workers threads. `tracks` can be a list or any iterator (such
+        as SpotifyResolver.iter_tracks): each track is submitted as soon as it
+        is produced. Results keep the input order, and every result carries its
+        'query' so failures can be reported per track.
+        on_track(result) is called as each track finishes; tracks found in
+        finished_tracks (query -> result, from a resumed job) whose files are
+        still on disk are not downloaded again.
+        """
+        total = len(tracks) if hasattr(tracks, '__len__') else None
+
+        @metrics.bind # Track threads add their spans to the job's trace
+        def run(index, track_name):
+            counter = f"{index+1}/{total}" if total else f"{index+1}"
+            done = (finished_tracks or {}).get(track_name)
+            if done and all(os.path.exists(f) for f in done.get('files') or []):
+                print(f"[{counter}] Already downloaded: {track_name}")
+                return dict(done, resumed=True)
+
+            print(f"[{counter}] Processing: {track_name}")
+            try:
+                # We treat the track_name as a search query
+                # FORCE YOUTUBE for Spotify results to avoid Remixes/Covers common on SC
+                res = self.process(track_name, output_path=output_path, no_cover=no_cover, format=format, force_youtube=True, progress_hook=progress_hook)
+            except Exception as e:
+                res = {"status": "error", "message": str(e)}
+            res = dict(res or {"status": "error", "message": "No result"})
+            res['query'] = track_name
+            if on_track:
+                try:
+                    on_track(res)
+                except Exception as e:
+                    print(f"Warning: could not record track {track_name}: {e}")
+            return res
+
+        try:
+            if self.playlist_workers == 1:
+                return [run(i, t) for i, t in enumerate(tracks)]
+
+            with ThreadPoolExecutor(max_workers=self.playlist_workers, thread_name_prefix="marto-track") as pool:
+                # Submit while the producer is still yielding; collect in submission order
+                futures = [pool.submit(run, i, t) for i, t in enumerate(tracks)]
+                return [f.result() for f in futures]
+        finally:
+            self.search_cache.save()
 
-    # Helper wrapper to support recursion specific args without changing public signature too much
-    # Actually, I'll just change the signature:
-    # def process(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", force_youtube: bool = False) -> dict:
-    
     def download_daronne(self, query: str, output_path: str) -> dict:
         import requests
         import random
@@ -93,7 +180,9 @@ class DownloaderManager:
         try:
             # Fake headers to avoid 403
             headers = {'User-Agent': 'Mozilla/5.0'}
-            resp = requests.get(url, headers=headers, allow_redirects=True)
+            with rate_limits.slot(url) as slot:
+                resp = requests.get(url, headers=headers, allow_redirects=True)
+                slot.report(resp.status_code, resp.headers.get('Retry-After'))
             
             if resp.status_code == 200:
                 # Save
@@ -112,80 +201,215 @@ class DownloaderManager:
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-    def process(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", force_youtube: bool = False) -> dict:
+    def process(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", force_youtube: bool = False, progress_hook=None,
+                on_track=None, finished_tracks=None) -> dict:
+        """
+        Resolves and downloads a query (URL or free text).
+        progress_hook, if given, is forwarded to yt-dlp as a progress hook.
+        on_track / finished_tracks are passed to process_tracks for playlists.
+        """
         # Handle 'Sa Daronne' format (Random Mom Image)
         if format == "daronne":
             return self.download_daronne(query, output_path)
 
         # Check for Spotify
-        spotify = SpotifyResolver()
+        spotify = self.spotify
         if spotify.accept(query):
              print("Spotify URL detected...")
              
              if spotify.is_playlist(query):
                  print("Playlist detected. Fetching tracks...")
-                 playlist_data = spotify.resolve_playlist(query)
+                 # Tracks are resolved in the background and fed to the download
+                 # pool one by one, so the first download starts after one lookup.
+                 playlist_data = spotify.iter_playlist(query)
                  pl_title = playlist_data.get('title', 'Unknown Playlist').replace("|", "").strip() # Clean title
-                 tracks = playlist_data.get('tracks', [])
+                 tracks = playlist_data['tracks']
                  
-                 print(f"Found playlist: '{pl_title}' with {len(tracks)} tracks.")
+                 print(f"Found playlist: '{pl_title}'. Downloading tracks as they are resolved.")
                  
                  # Create playlist sub-directory
-                 # Sanitize folder name
-                 safe_title = "".join([c for c in pl_title if c.isalpha() or c.isdigit() or c in " .-_()"]).strip()
+                 safe_title = sanitize_folder_name(pl_title)
                  playlist_path = os.path.join(output_path, safe_title)
                  os.makedirs(playlist_path, exist_ok=True)
                  
                  print(f"Downloading to: {playlist_path}")
                  
-                 results = []
-                 for i, track_name in enumerate(tracks):
-                     print(f"[{i+1}/{len(tracks)}] Processing: {track_name}")
-                     # Recursive call for the track
-                     # We treat the track_name as a search query
-                     # FORCE YOUTUBE for Spotify results to avoid Remixes/Covers common on SC
-                     # Use 'Official Audio' to improve accuracy? default ytdlp search is usually decent.
-                     # But appending " Audio" can help.
-                     res = self.process(track_name, output_path=playlist_path, no_cover=no_cover, format=format, force_youtube=True)
-                     results.append(res)
-                     
-                 return {"status": "success", "title": pl_title, "files": [r.get('files') for r in results], "is_playlist": True}
+                 results = self.process_tracks(tracks, playlist_path, no_cover=no_cover, format=format, progress_hook=progress_hook,
+                                               on_track=on_track, finished_tracks=finished_tracks)
+                 failed = [r for r in results if r.get('status') != 'success']
+                 if failed:
+                     print(f"Playlist done: {len(failed)}/{len(results)} tracks failed.")
+
+                 return {
+                     "status": "success",
+                     "title": pl_title,
+                     "files": [r.get('files') for r in results],
+                     "tracks": results,
+                     "failed": len(failed),
+                     "is_playlist": True
+                 }
 
              else:
                  # Single track
                  print("Resolving metadata...")
                  resolved = spotify.resolve(query)
+                 spotify.cache.save()
                  if resolved:
                      print(f"Resolved to: {resolved}")
                      query = resolved # Treat as search query now
-                     return self.process(query, output_path=output_path, no_cover=no_cover, format=format, force_youtube=True)
+                     return self.process(query, output_path=output_path, no_cover=no_cover, format=format, force_youtube=True, progress_hook=progress_hook)
                  else:
                      return {"status": "error", "message": "Could not resolve Spotify URL"}
 
         # Check if it's a specific URL (SoundCloud/YouTube)
         for downloader in self.downloaders:
             if downloader.accept(query):
+                from .ytdl import source_id_for_url
+                # Same video under another URL form (or found earlier by a search) is reused too
+                query_key = "url:" + normalize_query(query)
+                cached = self._from_cache(query_key, source_id_for_url(query), output_path, format)
+                if cached:
+                    return self._notify_files(cached)
+
                 # Ensure downloaders accept 'format'
-                return downloader.download(query, output_path, no_cover=no_cover, format=format)
-        
+                result = downloader.download(query, output_path, no_cover=no_cover, format=format, progress_hook=progress_hook)
+                self._remember(query_key, result, format)
+                return self._notify_files(result)
+
         # Search Block
-        if force_youtube:
-             print(f"Forcing YouTube search for: {query}")
-             yt = YouTubeDownloader()
-             search_query = f"ytsearch1:{query}"
-             return yt.download(search_query, output_path, no_cover=no_cover, format=format)
-
-        # Default Search Priority: SoundCloud -> YouTube
-        print("Input detected as search query. Searching on SoundCloud...")
-        sc = SoundCloudDownloader()
-        search_query = f"scsearch1:{query}"
-        result = sc.download(search_query, output_path, no_cover=no_cover, format=format)
-        
-        if result['status'] == 'success':
-            return result
-            
-        # Fallback to YouTube
-        print("SoundCloud search failed or empty. Falling back to YouTube...")
-        yt = YouTubeDownloader()
-        search_query = f"ytsearch1:{query}"
-        return yt.download(search_query, output_path, no_cover=no_cover, format=format)
+        # A query already resolved (for this route) skips the network entirely
+        query_key = ("yt:" if force_youtube else "sc+yt:") + normalize_query(query)
+        cached = self._from_cache(query_key, None, output_path, format)
+        if cached:
+            return self._notify_files(cached)
+
+        result = self._search(query, output_path, no_cover=no_cover, format=format, force_youtube=force_youtube, progress_hook=progress_hook)
+        self._remember(query_key, result, format)
+        return self._notify_files(result)
+
+    def _search(self, query: str, output_path: str, no_cover: bool = False, format: str = "flac", force_youtube: bool = False, progress_hook=None) -> dict:
+        """
+        Resolves the query to a track URL (cached) then downloads that URL.
+        Priority: SoundCloud first, YouTube as fallback (YouTube only if force_youtube).
+        """
+        yt_lookup = None
+        yt_cancel = threading.Event()
+        if not force_youtube:
+            # Default Search Priority: SoundCloud -> YouTube
+            print("Input detected as search query. Searching on SoundCloud...")
+            found, hit = self._cached_search("sc", query)
+            if not found and self.race_search:
+                start_yt = lambda: self._search_pool.submit(metrics.bind(self._resolve_search), "yt", query, yt_cancel)
+                if not self.race_delay:
+                    yt_lookup = start_yt()
+                sc_lookup = self._search_pool.submit(metrics.bind(self._resolve_search), "sc", query)
+                try:
+                    hit = sc_lookup.result(timeout=self.race_delay or None)
+                except FutureTimeoutError:
+                    # SoundCloud is slow: look YouTube up meanwhile, so a miss
+                    # costs about max(sc, yt) instead of sc + yt. SoundCloud still wins if it has a hit.
+                    yt_lookup = start_yt()
+                    hit = sc_lookup.result()
+            elif not found:
+                hit = self._resolve_search("sc", query)
+
+            if hit:
+                if yt_lookup is not None:
+                    # SoundCloud won: YouTube stops unless its request is already sent
+                    yt_cancel.set()
+                    if yt_lookup.cancel():
+                        yt_lookup = None # Still queued: nothing wasted
+                from .soundcloud import SoundCloudDownloader
+                result = self._download_hit(SoundCloudDownloader(keep_lossy=self.keep_lossy), hit, output_path, no_cover, format, progress_hook)
+                if result['status'] == 'success':
+                    if yt_lookup is not None:
+                        yt_lookup.add_done_callback(_count_wasted_lookup)
+                    return result
+
+            # Fallback to YouTube
+            print("SoundCloud search failed or empty. Falling back to YouTube...")
+            metrics.inc('marto_retries_total', help="Operations tried again", reason='youtube_fallback')
+        else:
+            print(f"Forcing YouTube search for: {query}")
+
+        hit = yt_lookup.result() if yt_lookup is not None else CANCELLED
+        if hit is CANCELLED:
+            hit = self._resolve_search("yt", query)
+        if not hit:
+            return {"status": "error", "message": "No results found"}
+        from .youtube import YouTubeDownloader
+        return self._download_hit(YouTubeDownloader(), hit, output_path, no_cover, format, progress_hook)
+
+    def _resolve_search(self, provider: str, query: str, cancelled: threading.Event = None):
+        """
+        {'url', 'source_id'} of the first 'scsearch1'/'ytsearch1' hit, or None.
+        Answers (including "no result") are cached; network errors are not.
+        CANCELLED when `cancelled` was set before the search was sent.
+        """
+        found, hit = self._cached_search(provider, query)
+        if found:
+            return hit
+
+        from .ytdl import search_first, SearchCancelled
+        metrics.inc('marto_cache_misses_total', help="Lookups a cache could not answer", cache='search')
+        key = f"{provider}:{normalize_query(query)}"
+        prefix = "scsearch1:" if provider == "sc" else "ytsearch1:"
+        try:
+            hit = search_first(prefix + query, cancelled)
+        except SearchCancelled:
+            return CANCELLED
+        except Exception as e:
+            print(f"Search failed on {provider}: {e}")
+            return None
+        self.search_cache.set(key, hit)
+        return hit
+
+    def _cached_search(self, provider: str, query: str) -> tuple:
+        """(found, hit) from the search cache only, no network."""
+        found, hit = self.search_cache.get(f"{provider}:{normalize_query(query)}")
+        if found:
+            metrics.inc('marto_cache_hits_total', help="Lookups answered from a cache", cache='search')
+            print(f"Search cache hit for '{query}' on {provider}: {hit['url'] if hit else 'no result'}")
+        return found, hit
+
+    def _download_hit(self, downloader, hit: dict, output_path: str, no_cover: bool, format: str, progress_hook) -> dict:
+        # The search told us which track it is: maybe we already have it
+        cached = self._from_cache(None, hit.get('source_id'), output_path, format)
+        if cached:
+            return cached
+        return downloader.download(hit['url'], output_path, no_cover=no_cover, format=format, progress_hook=progress_hook)
+
+    def _from_cache(self, query_key: str, source_id: str, output_path: str, format: str):
+        """Result built from an earlier download of the same query/source, or None."""
+        if self.download_cache is None:
+            return None
+        source_id = source_id or self.download_cache.source_for_query(query_key)
+        if not source_id:
+            return None
+        cached = self.download_cache.lookup(source_id, format)
+        if not cached:
+            metrics.inc('marto_cache_misses_total', help="Lookups a cache could not answer", cache='download')
+            return None
+        try:
+            path, method = self.download_cache.materialize(cached, output_path)
+        except OSError as e:
+            print(f"Warning: could not reuse cached file {cached['path']}: {e}")
+            return None
+
+        print(f"Already downloaded ({source_id}), reused via {method}: {path}")
+        metrics.inc('marto_cache_hits_total', help="Lookups answered from a cache", cache='download')
+        return {
+            "status": "success",
+            "title": cached['title'],
+            "source_id": source_id,
+            "files": [path],
+            "cached": True
+        }
+
+    def _remember(self, query_key: str, result: dict, format: str):
+        if self.download_cache is None or not result or result.get('status') != 'success':
+            return
+        files = result.get('files') or []
+        # Only single-file results of a known source can be reused
+        if result.get('source_id') and len(files) == 1 and os.path.isfile(files[0]):
+            self.download_cache.remember(result['source_id'], format, files[0], title=result.get('title'), query_key=query_key)
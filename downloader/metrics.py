@@ -0,0 +1,211 @@
+"""
+Timing spans and counters for the download pipeline, exported in the
+Prometheus text format (/metrics) and, per job, as a trace.
+
+Stages timed with metrics.span(stage, ...):
+    wait          waiting for a rate limiter slot (histogram only)
+    resolve       Spotify track/playlist page, Deezer link -> download objects
+    search        scsearch/ytsearch lookup
+    extract       yt-dlp metadata of a URL (no download)
+    download      transfer of the media (yt-dlp, deemix)
+    postprocess   ffmpeg post-processors, waiting for the transcode pool included
+    thumbnails    cleanup of the thumbnails nothing embedded
+    library_scan  LibraryIndex.sync of a library folder
+    job           a whole JobQueue job
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the span duration histogram buckets
+SPAN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+SPAN_METRIC = 'marto_stage_seconds'
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+class Trace:
+    """
+    Spans of one job as they end: stage, labels, start (seconds after the
+    trace started), duration, thread and error. Keeps the first `max_spans`.
+    """
+
+    def __init__(self, name: str = None, max_spans: int = 10000):
+        self.name = name
+        self.started_at = time.time()
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, started: float, duration: float, labels: dict, error: str = None):
+        span = {
+            'stage': stage,
+            'start': round(started - self._t0, 4),
+            'duration': round(duration, 4),
+            'thread': threading.current_thread().name,
+        }
+        span.update(labels)
+        if error:
+            span['error'] = error
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            totals[span['stage']] = round(totals.get(span['stage'], 0) + span['duration'], 4)
+        return {'name': self.name, 'started_at': self.started_at, 'totals': totals, 'spans': spans, 'dropped': self.dropped}
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+class Metrics:
+    """
+    Process-wide registry of counters, gauges and span histograms. The trace
+    of the current job is per thread: code that hands work to other threads
+    wraps it with bind() so those spans land in the same trace.
+    """
+
+    def __init__(self, buckets: tuple = SPAN_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {} # name -> {labels: value}
+        self._gauges = {}
+        self._histograms = {} # labels -> [count per bucket..., +Inf count, sum]
+        self._local = threading.local()
+
+    def inc(self, name: str, value: float = 1, help: str = None, **labels):
+        """Adds `value` to counter `name` (ends with _total by convention)."""
+        key = _labels(labels)
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, help: str = None, **labels):
+        key = _labels(labels)
+        with self._lock:
+            if help:
+                self._help.setdefault(name, help)
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, stage: str, seconds: float, **labels):
+        """Records one duration of `stage` in the span histogram."""
+        key = _labels(dict(labels, stage=stage))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        Times the block as one `stage` span (histogram + current trace).
+        An exception raised inside also counts in marto_errors_total.
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.observe(stage, duration, **labels)
+            if error:
+                self.inc('marto_errors_total', help="Pipeline stages that raised", stage=stage, error=error)
+            trace = self.current_trace()
+            if trace is not None:
+                trace.add(stage, started, duration, {k: v for k, v in labels.items() if v is not None}, error)
+
+    def current_trace(self):
+        return getattr(self._local, 'trace', None)
+
+    @contextmanager
+    def tracing(self, trace: Trace):
+        """Spans of the calling thread go to `trace` inside the block."""
+        previous = self.current_trace()
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = previous
+
+    def bind(self, fn):
+        """fn, running under the caller's current trace in whichever thread calls it."""
+        trace = self.current_trace()
+        if trace is None:
+            return fn
+
+        def traced(*args, **kwargs):
+            with self.tracing(trace):
+                return fn(*args, **kwargs)
+        return traced
+
+    def render(self) -> str:
+        """Everything recorded so far, in the Prometheus text exposition format."""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            help_texts = dict(self._help)
+
+        lines = []
+
+        def header(name, kind):
+            if name in help_texts:
+                lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted(counters):
+            header(name, 'counter')
+            lines += [f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(counters[name].items())]
+        for name in sorted(gauges):
+            header(name, 'gauge')
+            lines += [f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(gauges[name].items())]
+
+        if histograms:
+            lines.append(f"# HELP {SPAN_METRIC} Time spent per pipeline stage")
+            lines.append(f"# TYPE {SPAN_METRIC} histogram")
+            for key, values in sorted(histograms.items()):
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f"{SPAN_METRIC}_bucket{_format_labels(key + (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{SPAN_METRIC}_bucket{_format_labels(key + (('le', '+Inf'),))} {values[-2]}")
+                lines.append(f"{SPAN_METRIC}_sum{_format_labels(key)} {values[-1]:g}")
+                lines.append(f"{SPAN_METRIC}_count{_format_labels(key)} {values[-2]}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the whole process (like ratelimit.rate_limits)
+metrics = Metrics()
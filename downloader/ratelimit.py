@@ -0,0 +1,216 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .metrics import metrics
+
+# Per-host settings; a host matches a key when it equals it or ends with '.<key>'.
+# Overridable with config/rate_limits.json (same shape, merged key by key).
+#   rate / burst:       token bucket, requests (or downloads) started per second
+#   min/max_concurrency: bounds of the adaptive number of parallel requests
+#   target_latency:     seconds; slower successes don't raise concurrency (None = ignore)
+#   cooldown:           seconds every request to the host waits after a 429 without Retry-After
+DEFAULT_RATE_LIMITS = {
+    'open.spotify.com': {'rate': 5, 'burst': 10, 'max_concurrency': 8, 'target_latency': 2.0},
+    'youtube.com': {'rate': 1, 'burst': 4, 'max_concurrency': 4},
+    'soundcloud.com': {'rate': 2, 'burst': 4, 'max_concurrency': 4},
+    'loremflickr.com': {'rate': 1, 'burst': 2, 'max_concurrency': 2},
+    '*': {'rate': 2, 'burst': 4, 'max_concurrency': 4},
+}
+
+# yt-dlp pseudo URLs / short links -> host whose limits apply
+HOST_ALIASES = {
+    'ytsearch': 'youtube.com',
+    'youtu.be': 'youtube.com',
+    'scsearch': 'soundcloud.com',
+}
+
+THROTTLE_STATUSES = (429, 403)
+HTTP_ERROR_RE = re.compile(r"HTTP Error (\d{3})")
+
+
+def host_of(query: str) -> str:
+    """Host a query/URL talks to ('ytsearch1:...' -> 'youtube.com')."""
+    if '://' in query:
+        host = (urlparse(query).hostname or '').lower()
+    else:
+        host = query.split(':', 1)[0].rstrip('0123456789').lower()
+    return HOST_ALIASES.get(host, host)
+
+
+def throttle_status(error) -> int:
+    """429/403 if the exception (e.g. a yt-dlp DownloadError) reports one, else None."""
+    match = HTTP_ERROR_RE.search(str(error))
+    if match and int(match.group(1)) in THROTTLE_STATUSES:
+        return int(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Lets `rate` acquisitions per second through, with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Slot:
+    """Handle given to the code holding a HostLimiter slot, to report the outcome."""
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+
+    def report(self, status: int, retry_after=None):
+        """Records the HTTP status (and Retry-After header) of the response."""
+        self.status = status
+        try:
+            self.retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            self.retry_after = None
+
+
+class HostLimiter:
+    """
+    Token bucket plus AIMD concurrency for one host: every throttled answer
+    (429/403) halves the allowed parallel requests and the request rate,
+    every `limit` healthy answers in a row add one parallel request and
+    recover some rate, up to the configured values.
+    """
+
+    def __init__(self, host: str, rate: float = None, burst: int = 1, min_concurrency: int = 1,
+                 max_concurrency: int = 4, initial_concurrency: int = None, target_latency: float = None,
+                 backoff: float = 0.5, cooldown: float = 10):
+        self.host = host
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(self.max_concurrency, max(self.min_concurrency, initial_concurrency or self.max_concurrency)))
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._active = 0
+        self._healthy = 0
+        self._blocked_until = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """
+        Waits for a free slot and a token, then yields a Slot. Exceptions
+        raised inside count as throttling when they mention HTTP 429/403.
+        """
+        waiting = time.perf_counter()
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait <= 0 and self._active < int(self.limit):
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            self._active += 1
+
+        slot = Slot()
+        started = time.monotonic()
+        try:
+            if self.bucket:
+                self.bucket.acquire()
+            metrics.observe('wait', time.perf_counter() - waiting, host=self.host)
+            yield slot
+        except Exception as e:
+            slot.status = slot.status or throttle_status(e) or 'error'
+            raise
+        finally:
+            self._record(slot, time.monotonic() - started)
+
+    def _record(self, slot: Slot, latency: float):
+        with self._cond:
+            self._active -= 1
+            if slot.status in THROTTLE_STATUSES:
+                self._healthy = 0
+                self.limit = max(self.min_concurrency, self.limit * self.backoff)
+                if self.bucket:
+                    self.bucket.rate = max(self.max_rate * 0.05, self.bucket.rate * self.backoff)
+                pause = slot.retry_after if slot.retry_after is not None else (self.cooldown if slot.status == 429 else 0)
+                self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+                print(f"Throttled by {self.host} ({slot.status}): {int(self.limit)} parallel, pausing {pause:.0f}s")
+                metrics.inc('marto_throttled_total', help="Answers that made a host limiter back off", host=self.host, status=slot.status)
+            elif slot.status is None or (isinstance(slot.status, int) and slot.status < 400):
+                if self.target_latency is None or latency <= self.target_latency:
+                    self._healthy += 1
+                    if self._healthy >= int(self.limit):
+                        self._healthy = 0
+                        self.limit = min(self.max_concurrency, self.limit + 1)
+                        if self.bucket:
+                            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * 0.1)
+            self._cond.notify_all()
+
+
+class RateLimits:
+    """Registry of HostLimiter, one per configured host (plus '*' for the rest)."""
+
+    def __init__(self, settings: dict = None):
+        self._lock = threading.Lock()
+        self._settings = {}
+        self._limiters = {}
+        self.configure(settings or DEFAULT_RATE_LIMITS)
+
+    def configure(self, settings: dict):
+        """Merges `settings` into the current ones; changed hosts get fresh limiters."""
+        with self._lock:
+            for host, values in settings.items():
+                merged = dict(self._settings.get(host) or {}, **values)
+                self._settings[host] = merged
+                self._limiters.pop(host, None)
+
+    def for_host(self, host: str) -> HostLimiter:
+        key = '*'
+        for name in self._settings:
+            if name != '*' and (host == name or host.endswith('.' + name)):
+                key = name
+                break
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = HostLimiter(key, **self._settings.get(key, {}))
+            return limiter
+
+    def slot(self, query: str):
+        """HostLimiter.slot() for the host of a URL or yt-dlp search query."""
+        return self.for_host(host_of(query)).slot()
+
+
+def load_rate_limits(path: str) -> dict:
+    """Defaults overridden by the JSON file at `path`, if it exists."""
+    settings = {host: dict(values) for host, values in DEFAULT_RATE_LIMITS.items()}
+    try:
+        with open(path, 'r', encoding="utf-8") as f:
+            for host, values in json.load(f).items():
+                settings.setdefault(host, {}).update(values)
+    except OSError:
+        pass
+    except ValueError as e:
+        print(f"Warning: ignoring invalid {path}: {e}")
+    return settings
+
+
+# Shared by every downloader and resolver of the process
+rate_limits = RateLimits()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class SearchCache:
+    """
+    Bounded LRU cache of search resolutions, persisted as JSON:
+        'sc:artist - title' -> {'url': ..., 'source_id': ...}
+    A None value is a negative entry ("SoundCloud had nothing") and expires
+    sooner than positive ones, since new uploads can appear.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl: float = 30 * 24 * 3600,
+                 negative_ttl: float = 24 * 3600, save_interval: float = 5):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # One writer of the JSON file at a time
+        self._entries = OrderedDict() # key -> [value, stored_at], least recently used first
+        self._dirty = False
+        self._saved_at = 0
+        self._timer = None
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                for key, entry in json.load(f):
+                    self._entries[key] = entry
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def _expired(self, entry) -> bool:
+        ttl = self.ttl if entry[0] is not None else self.negative_ttl
+        return time.time() - entry[1] >= ttl
+
+    def get(self, key: str) -> tuple:
+        """Returns (found, value). value is None for a cached 'no result'."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if self._expired(entry):
+                del self._entries[key]
+                self._dirty = True
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = [value, time.time()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        self._schedule_save()
+
+    def _schedule_save(self):
+        # Write at most every save_interval seconds, but never forget a change
+        with self._lock:
+            if self._timer is not None:
+                return
+            delay = max(0, self.save_interval - (time.time() - self._saved_at))
+            if delay > 0:
+                self._timer = threading.Timer(delay, self.save)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.save()
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                self._timer = None
+                if not self._dirty:
+                    return
+                data = json.dumps([[k, v] for k, v in self._entries.items() if not self._expired(v)])
+                self._dirty = False
+                self._saved_at = time.time()
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Warning: could not save search cache: {e}")
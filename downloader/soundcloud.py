@@ -1,119 +1,88 @@
 from .base import BaseDownloader
-import yt_dlp
-import os
-import imageio_ffmpeg
+from .ytdl import ydl_pool, source_id, get_ffmpeg_location, extract_and_download, downloaded_files, remove_thumbnails
+from .ratelimit import rate_limits
+from .transcode import run_postprocessors
+from .formats import format_selector, negotiate
 
 class SoundCloudDownloader(BaseDownloader):
+    def __init__(self, keep_lossy: bool = True):
+        """keep_lossy: keep lossy sources as they are when FLAC is requested (see formats.negotiate)."""
+        self.keep_lossy = keep_lossy
+
     def accept(self, query: str) -> bool:
         # Simple check for soundcloud URL
         return "soundcloud.com" in query
 
-    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac") -> dict:
+    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "flac", progress_hook=None) -> dict:
         print(f"Downloading from SoundCloud: {query}")
         
-        # 1. Check if it's a playlist/set first (Fast check)
-        # We need to peek at metadata without downloading
-        # SKIP if it's a search query (scsearch...) because search results are technically playlists
-        if not query.startswith("scsearch"):
-            try:
-                with yt_dlp.YoutubeDL({'quiet': True, 'ignoreerrors': True}) as ydl_peek:
-                    info_peek = ydl_peek.extract_info(query, download=False, process=False)
-                    
-                    # Check for playlist
-                    # Note: process=False returns a generator for entries sometimes, or dict.
-                    # If _type is playlist, update path.
-                    if info_peek and info_peek.get('_type') == 'playlist':
-                        pl_title = info_peek.get('title', 'Unknown Playlist')
-                        # Sanitize
-                        safe_title = "".join([c for c in pl_title if c.isalpha() or c.isdigit() or c in " .-_()"]).strip()
-                        print(f"SoundCloud Playlist detected: '{pl_title}'. creating subfolder.")
-                        output_path = os.path.join(output_path, safe_title)
-
-            except Exception as e:
-                print(f"Warning checking playlist status: {e}")
-
-        # Ensure output directory exists (updated or original)
-        os.makedirs(output_path, exist_ok=True)
-        
-        # Post-processors config
-        postprocessors = [
-            {'key': 'FFmpegExtractAudio','preferredcodec': format},
-            {'key': 'FFmpegMetadata', 'add_metadata': True},
-        ]
-        
-        if not no_cover:
-             postprocessors.append({'key': 'EmbedThumbnail'})
-
+        # Output folder is set per borrow (paths.home), so the same
+        # pooled YoutubeDL serves every folder.
+        # The network stage only fetches the raw stream (+ thumbnail);
+        # postprocessors run afterwards on the transcode pool.
         ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'ffmpeg_location': imageio_ffmpeg.get_ffmpeg_exe(),
+            # Prefer a stream already in the requested codec: no encode needed then
+            'format': format_selector(format),
+            'outtmpl': '%(title)s.%(ext)s',
             'writethumbnail': not no_cover,
             'addmetadata': True,
-            'postprocessors': postprocessors,
             'quiet': False,
             'no_warnings': False,
+            # yt-dlp's own fixups and format merging still run in this stage
+            'ffmpeg_location': get_ffmpeg_location(),
         }
+        profile = f"audio-negotiated:{format}" if no_cover else f"audio-negotiated:{format}:cover"
+
+        # Post-processors config, chosen per downloaded file from its actual codec
+        decisions = []
+
+        def postprocess_opts(file_info):
+            decision = negotiate(format, file_info.get('acodec'), file_info.get('ext'), keep_lossy=self.keep_lossy)
+            decisions.append(decision)
+            print(f"Format: {decision['action']} ({decision['reason']})")
+
+            postprocessors = []
+            if decision['preferredcodec']:
+                postprocessors.append({'key': 'FFmpegExtractAudio', 'preferredcodec': decision['preferredcodec']})
+            postprocessors.append({'key': 'FFmpegMetadata', 'add_metadata': True})
+            if not no_cover:
+                postprocessors.append({'key': 'EmbedThumbnail'})
+            return {'ffmpeg_location': get_ffmpeg_location(), 'postprocessors': postprocessors}
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(query, download=True)
-                
-                # Handle search results (playlist)
-                if 'entries' in info:
-                    if not info['entries']:
-                         return {"status": "error", "message": "No results found"}
-                    # For search results, we usually just want the first one
-                    # But yt-dlp might have downloaded all if we didn't limit?
-                    # scsearch1: limits to 1.
-                    info = info['entries'][0]
+            # Per-host rate limit: backs off by itself when SoundCloud answers 429/403
+            with rate_limits.slot(query), \
+                    ydl_pool.borrow(profile, ydl_opts, output_path=output_path, progress_hook=progress_hook) as ydl:
+                # Single pass: metadata is fetched once and reused for the download.
+                # SKIP the playlist subfolder for search queries (scsearch...) because search results are technically playlists
+                info, output_path = extract_and_download(ydl, query, output_path, playlist_folder=not query.startswith("scsearch"))
+
+            # Network slot released: extract audio / tag / embed cover on the CPU pool
+            info = run_postprocessors(info, postprocess_opts)
+
+            # Paths as written by yt-dlp (every track of a set): titles get
+            # sanitized and the extension depends on the format negotiation
+            files = downloaded_files(info)
+            remove_thumbnails(info)
 
-                filename = info.get('title') # Fallback
-                
-                # Cleanup Thumbnails
-                # yt-dlp leaves the thumbnail file even if embedded. We delete it manually.
-                # Sanitize title for filename matching roughly (yt-dlp sanitization might vary, but we catch standard ones)
-                # Safer: list dir and check for files starting with the title and ending in image ext
-                
-                try:
-                    import glob
-                    # We need to handle potential sanitization in filenames. 
-                    # But simplified: look for files in output_path
-                    # We use the title we extracted.
-                    
-                    # Note: filenames might differ if yt-dlp sanitized characters.
-                    # Best effort: Use info['requested_downloads'][0]['filepath'] to guess? 
-                    # Or just wildcard matching based on title prefix if unique enough.
-                    
-                    # Let's iterate over common image extensions
-                    for ext in ['*.jpg', '*.jpeg', '*.png', '*.webp']:
-                         # Careful not to delete other songs.
-                         # We can assume the filename starts with the title.
-                         # But checking exact match is hard without sanitization func.
-                         # Let's try to find files that match the base name of the downloaded file?
-                         pass
-                         
-                    # Revised approach: 
-                    # We know the output template is '%(title)s.%(ext)s'
-                    # So the thumbnail should be 'Title.jpg' etc.
-                    # We just try to delete them.
-                    
-                    base_name = info.get('title')
-                    # Sanitize strictly if needed, but for now try direct
-                    for img_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                        thumb_path = os.path.join(output_path, f"{base_name}{img_ext}")
-                        if os.path.exists(thumb_path):
-                            os.remove(thumb_path)
-                            print(f"Cleaned up thumbnail: {thumb_path}")
-                            
-                except Exception as cleanup_err:
-                    print(f"Warning: Could not cleanup thumbnail: {cleanup_err}")
+            # Handle search results (playlist)
+            if 'entries' in info:
+                if not info['entries']:
+                     return {"status": "error", "message": "No results found"}
+                # For search results, we usually just want the first one
+                # scsearch1: limits to 1.
+                info = info['entries'][0]
 
-                return {
-                    "status": "success",
-                    "title": info.get('title'),
-                    "files": [os.path.join(output_path, f"{info.get('title')}.{format}")] 
-                }
+            if not files:
+                return {"status": "error", "message": "No file was downloaded"}
+
+            return {
+                "status": "success",
+                "title": info.get('title'),
+                "source_id": source_id(info),
+                "files": files,
+                "transcode": decisions[0] if len(decisions) == 1 else decisions
+            }
         except Exception as e:
             return {
                 "status": "error",
@@ -1,73 +1,203 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
+from .config import get_config_dir
+from .ratelimit import rate_limits
+from .metrics import metrics
+
+TRACK_ID_RE = re.compile(r"/track/([A-Za-z0-9]+)")
+
+
+class SpotifyTrackCache:
+    """
+    Persistent {track_id: 'Artist - Title'} cache stored as JSON.
+    Entries older than `ttl` seconds are ignored and refreshed.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = {}
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, track_id: str):
+        with self._lock:
+            entry = self._entries.get(track_id)
+        if entry and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def set(self, track_id: str, name: str):
+        with self._lock:
+            self._entries[track_id] = [name, time.time()]
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            # Drop expired entries while we are at it
+            self._entries = {k: v for k, v in self._entries.items() if now - v[1] < self.ttl}
+            data = json.dumps(self._entries)
+            self._dirty = False
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not save Spotify cache: {e}")
+
+
 class SpotifyResolver:
+    def __init__(self, max_workers: int = 8, cache_path: str = None, cache_ttl: float = 7 * 24 * 3600):
+        """
+        max_workers: concurrent track page fetches when resolving a playlist.
+        cache_path: JSON file for resolved track names (default: config/spotify_tracks.json).
+        """
+        self.max_workers = max(1, max_workers)
+
+        # One keep-alive session shared by all lookups (and threads)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        if cache_path is None:
+            cache_path = str(get_config_dir() / 'spotify_tracks.json')
+        self.cache = SpotifyTrackCache(cache_path, ttl=cache_ttl)
+
+    def _get(self, url: str):
+        # Shared per-host limiter: Spotify throttles scrapers quickly
+        with rate_limits.slot(url) as slot:
+            response = self.session.get(url)
+            slot.report(response.status_code, response.headers.get('Retry-After'))
+        return response
+
     def accept(self, query: str) -> bool:
         return "open.spotify.com" in query
 
     def is_playlist(self, query: str) -> bool:
         return "playlist" in query
 
+    @staticmethod
+    def track_id(url: str):
+        match = TRACK_ID_RE.search(url)
+        return match.group(1) if match else None
+
     def resolve_playlist(self, url: str) -> dict:
         """
         Resolves a Spotify playlist URL to a list of 'Artist - Title' strings.
         Returns: {'title': 'Playlist Name', 'tracks': ['Artist - Song', ...]}
         """
+        playlist = self.iter_playlist(url)
+        return {
+            "title": playlist['title'],
+            "tracks": list(playlist['tracks'])
+        }
+
+    def iter_playlist(self, url: str) -> dict:
+        """
+        Same as resolve_playlist, but 'tracks' is an iterator that yields each
+        'Artist - Title' (in playlist order) as soon as it is resolved, so
+        callers can start downloading before the whole playlist is known.
+        Returns: {'title': 'Playlist Name', 'tracks': <iterator of str>}
+        """
         try:
-            response = requests.get(url)
+            with metrics.span('resolve', host='open.spotify.com', kind='playlist'):
+                response = self._get(url)
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
-                
+
                 # Get Playlist Title
                 title_tag = soup.find('h1')
                 playlist_title = title_tag.text.strip() if title_tag else "Unknown Playlist"
-                
+
                 # Extract Tracks
-                # Spotify's public HTML structure changes often. 
-                # Meta tags are usually reliable for at least some tracks.
-                # Or looking for specific link patterns /track/
-                
-                tracks = []
-                # Finding all links that look like tracks
+                # Spotify's public HTML structure changes often.
+                # Looking for specific link patterns /track/ is the most reliable.
                 # Note: This scrapes the visible links. Infinite scroll might hide some on very long playlists,
                 # but for a simple tool this covers the initial batch (usually 30-100).
-                track_links = soup.find_all('a', href=True)
-                
+                track_urls = []
                 seen_sub_urls = set()
 
-                for link in track_links:
+                for link in soup.find_all('a', href=True):
                     href = link['href']
                     if "/track/" in href:
                         # Avoid duplicates
                         if href in seen_sub_urls:
                             continue
                         seen_sub_urls.add(href)
-                        
-                        # We can either resolve each URL (slow) or try to find the text in the <a> tag or nearby
-                        # Often the link text is the song name or parsing the title attribute.
-                        
-                        # Let's try to just collect the URLs and rely on our single-track resolver?
-                        # Or resolving them here is better for batching.
                         full_url = "https://open.spotify.com" + href if href.startswith("/") else href
-                        resolved_name = self.resolve(full_url)
-                        if resolved_name:
-                             tracks.append(resolved_name)
+                        track_urls.append(full_url)
 
                 return {
                     "title": playlist_title,
-                    "tracks": tracks
+                    "tracks": self.iter_tracks(track_urls)
                 }
         except Exception as e:
             print(f"Error resolving Spotify Playlist: {e}")
-        return {"title": "Error", "tracks": []}
+        return {"title": "Error", "tracks": iter(())}
+
+    def iter_tracks(self, track_urls: list):
+        """
+        Resolves track URLs concurrently (max_workers) and yields the names in
+        order, skipping tracks that could not be resolved.
+        """
+        if len(track_urls) <= 1 or self.max_workers == 1:
+            try:
+                for track_url in track_urls:
+                    name = self.resolve(track_url)
+                    if name:
+                        yield name
+            finally:
+                self.cache.save()
+            return
+
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(track_urls)), thread_name_prefix="marto-spotify")
+        try:
+            resolve = metrics.bind(self.resolve)
+            futures = [pool.submit(resolve, track_url) for track_url in track_urls]
+            for future in futures:
+                name = future.result()
+                if name:
+                    yield name
+        finally:
+            # Consumer may stop early: don't wait for lookups nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.cache.save()
 
     def resolve(self, url: str) -> str:
         """
         Fetches the Spotify page and extracts 'Track - Artist' from the title.
-        This avoids needing API keys.
+        This avoids needing API keys. Results are cached by track id.
         """
+        track_id = self.track_id(url)
+        if track_id:
+            cached = self.cache.get(track_id)
+            if cached:
+                metrics.inc('marto_cache_hits_total', help="Lookups answered from a cache", cache='spotify')
+                return cached
+            metrics.inc('marto_cache_misses_total', help="Lookups a cache could not answer", cache='spotify')
+
         try:
-            response = requests.get(url)
+            with metrics.span('resolve', host='open.spotify.com', kind='track'):
+                response = self._get(url)
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
                 title_tag = soup.find('title')
@@ -75,6 +205,8 @@ class SpotifyResolver:
                     # Title format is usually "Song - Artist | Spotify"
                     page_title = title_tag.text
                     clean_title = page_title.replace(" | Spotify", "")
+                    if track_id:
+                        self.cache.set(track_id, clean_title)
                     return clean_title
         except Exception as e:
             print(f"Error resolving Spotify URL: {e}")
@@ -0,0 +1,98 @@
+import os
+import threading
+
+from .metrics import metrics
+
+# CPU stage of the download pipeline: network workers only fetch the raw
+# audio, then yt-dlp's post-processors (FFmpegExtractAudio, FFmpegMetadata,
+# EmbedThumbnail...) run here, so a transcode never holds a network slot.
+_pool = None
+_pool_size = os.cpu_count() or 1
+_pool_lock = threading.Lock()
+
+# One YoutubeDL per post-processor config, per pool thread
+_worker_ydls = threading.local()
+
+
+def set_transcode_workers(workers: int = None):
+    """Sets the number of post-processing workers (default: one per CPU)."""
+    global _pool, _pool_size
+    with _pool_lock:
+        _pool_size = max(1, workers or os.cpu_count() or 1)
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def get_transcode_pool():
+    """
+    Thread pool shared by all downloads, created on first use. Threads are
+    enough: the CPU work happens in the ffmpeg child processes. (A forked
+    worker process would also inherit the pipes other threads are starting
+    ffmpeg through, and hang them.)
+    """
+    global _pool
+    from concurrent.futures import ThreadPoolExecutor
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="marto-transcode")
+        return _pool
+
+
+def _postprocess_file(filepath: str, info: dict, params: dict) -> dict:
+    # Runs in a pool thread: the YoutubeDL is only a container for the post-processors
+    import yt_dlp
+    key = repr(sorted(params.items()))
+    ydls = getattr(_worker_ydls, 'by_params', None)
+    if ydls is None:
+        ydls = _worker_ydls.by_params = {}
+    ydl = ydls.get(key)
+    if ydl is None:
+        ydl = ydls[key] = yt_dlp.YoutubeDL(dict(params, quiet=True, no_warnings=True))
+    return yt_dlp.YoutubeDL.sanitize_info(ydl.post_process(filepath, info))
+
+
+def run_postprocessors(info: dict, params) -> dict:
+    """
+    Runs params['postprocessors'] on every file downloaded for `info` (a
+    video, or a playlist of them) on the transcode pool, all files at once.
+    `params` can also be a function of the file's info dict, to choose the
+    post-processors per file (see formats.negotiate).
+    requested_downloads[*]['filepath'] / ['ext'] are updated to the final files.
+    Returns info; post-processing errors are raised.
+    """
+    with metrics.span('postprocess'):
+        return _run_postprocessors(info, params)
+
+
+def _run_postprocessors(info: dict, params) -> dict:
+    # yt-dlp is already loaded by the download that produced the files
+    import yt_dlp
+    params_for = params if callable(params) else (lambda _info: params)
+
+    if info.get('_type') == 'playlist':
+        videos = [entry for entry in info.get('entries') or [] if entry]
+    else:
+        videos = [info]
+
+    pool = get_transcode_pool()
+    pending = []
+    for video in videos:
+        base = {k: v for k, v in video.items() if k not in ('requested_downloads', 'entries')}
+        for download in video.get('requested_downloads') or []:
+            if not download.get('filepath'):
+                continue
+            # requested_downloads only keeps the keys that differ from the video info.
+            # '__' keys are yt-dlp internals of the network stage (fixup PPs already ran there)
+            full = {k: v for k, v in dict(base, **download).items() if not k.startswith('__')}
+            full = yt_dlp.YoutubeDL.sanitize_info(full)
+            file_params = params_for(full)
+            if not file_params.get('postprocessors'):
+                continue
+            pending.append((download, pool.submit(_postprocess_file, full['filepath'], full, file_params)))
+
+    for download, future in pending:
+        done = future.result()
+        download['filepath'] = done.get('filepath')
+        download['ext'] = done.get('ext')
+    return info
@@ -1,65 +1,67 @@
 from .base import BaseDownloader
-import yt_dlp
-import os
+from .ytdl import ydl_pool, source_id, get_ffmpeg_location, extract_and_download, downloaded_files, remove_thumbnails
+from .ratelimit import rate_limits
+from .transcode import run_postprocessors
 
 class YouTubeDownloader(BaseDownloader):
     def accept(self, query: str) -> bool:
         return "youtube.com" in query or "youtu.be" in query
 
-    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "m4a") -> dict:
+    def download(self, query: str, output_path: str = ".", no_cover: bool = False, format: str = "m4a", progress_hook=None) -> dict:
         print(f"Downloading from YouTube: {query}")
         
-        # 1. Check if it's a playlist
-        if not query.startswith("ytsearch"):
-            try:
-                with yt_dlp.YoutubeDL({'quiet': True, 'ignoreerrors': True}) as ydl_peek:
-                    info_peek = ydl_peek.extract_info(query, download=False, process=False)
-                    
-                    if info_peek and info_peek.get('_type') == 'playlist':
-                        pl_title = info_peek.get('title', 'Unknown Playlist')
-                        safe_title = "".join([c for c in pl_title if c.isalpha() or c.isdigit() or c in " .-_()"]).strip()
-                        output_path = os.path.join(output_path, safe_title)
-            except Exception as e:
-                print(f"Debug: Playlist check skipped or failed: {e}")
-
-        os.makedirs(output_path, exist_ok=True)
-        
         # Mobile Optimization: No FFmpeg/Conversion
         # We download 'm4a' directly which is native Android audio.
         postprocessors = []
         if not no_cover:
             postprocessors.append({'key': 'EmbedThumbnail'})
 
+        # Output folder is set per borrow (paths.home), so the same
+        # pooled YoutubeDL serves every folder.
         ydl_opts = {
             'format': 'bestaudio[ext=m4a]/bestaudio/best',
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+            'outtmpl': '%(title)s.%(ext)s',
             'writethumbnail': not no_cover,
             'addmetadata': True,
-            'postprocessors': postprocessors,
             'quiet': False,
             'no_warnings': False,
+            # yt-dlp's own fixups and format merging still run in this stage
+            'ffmpeg_location': get_ffmpeg_location(),
         }
+        profile = 'audio-m4a' if no_cover else 'audio-m4a:cover'
+        # Cover embedding runs on the transcode pool once the network slot is free
+        postprocess_opts = {'ffmpeg_location': get_ffmpeg_location(), 'postprocessors': postprocessors}
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(query, download=True)
-                
-                # Cleanup Thumbnails
-                try:
-                    base_name = info.get('title')
-                    for img_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                        thumb_path = os.path.join(output_path, f"{base_name}{img_ext}")
-                        if os.path.exists(thumb_path):
-                            os.remove(thumb_path)
-                            print(f"Cleaned up thumbnail: {thumb_path}")
-                except Exception as e:
-                    print(f"Warning cleaning thumbnail: {e}")
+            # Per-host rate limit: backs off by itself when YouTube answers 429/403
+            with rate_limits.slot(query), \
+                    ydl_pool.borrow(profile, ydl_opts, output_path=output_path, progress_hook=progress_hook) as ydl:
+                # Single pass: metadata is fetched once and reused for the download.
+                # Search results are technically playlists, so no subfolder for those.
+                info, output_path = extract_and_download(ydl, query, output_path, playlist_folder=not query.startswith("ytsearch"))
+
+            info = run_postprocessors(info, postprocess_opts)
+
+            # Search results come back as a one-entry playlist
+            if query.startswith("ytsearch") and info.get('entries') is not None:
+                if not info['entries']:
+                    return {"status": "error", "message": "No results found"}
+                info = info['entries'][0]
 
-                return {
-                    "status": "success",
-                    "title": info.get('title'),
-                    "files": [os.path.join(output_path, f"{info.get('title')}.{format}")]
-                }
+            # Thumbnails yt-dlp wrote but didn't embed (real paths, no guessing)
+            remove_thumbnails(info)
+
+            # Paths as written by yt-dlp: titles get sanitized and the container may differ
+            files = downloaded_files(info)
+            if not files:
+                return {"status": "error", "message": "No file was downloaded"}
+
+            return {
+                "status": "success",
+                "title": info.get('title'),
+                "source_id": source_id(info),
+                "files": files
+            }
         except Exception as e:
             return {
                 "status": "error",
@@ -0,0 +1,213 @@
+import os
+import threading
+from contextlib import contextmanager
+import yt_dlp
+from .base import sanitize_folder_name
+from .ratelimit import rate_limits, host_of
+from .metrics import metrics
+
+# Interrupted transfers stay on disk as .part files (plus a .ytdl state file
+# for fragmented streams) and are continued with HTTP Range requests the next
+# time the same track is downloaded, e.g. when a journaled job is resumed.
+# That is yt-dlp's default (continuedl, no nopart): params must not turn it off.
+
+
+_ffmpeg_exe = None
+
+
+def get_ffmpeg_location() -> str:
+    """Path of the bundled ffmpeg binary, looked up once per process."""
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        import imageio_ffmpeg
+        _ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+    return _ffmpeg_exe
+
+
+class PooledYoutubeDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL whose progress is forwarded to `current_progress_hook`, which
+    can be swapped between downloads when the instance is reused.
+    Post-processing (ffmpeg) is not configured here: it runs afterwards on
+    the transcode pool (see transcode.run_postprocessors).
+    """
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.current_progress_hook = None
+        self.add_progress_hook(self._forward_progress)
+
+    def _forward_progress(self, d):
+        hook = self.current_progress_hook
+        if hook:
+            hook(d)
+
+
+class YoutubeDLPool:
+    """
+    Per-thread cache of configured YoutubeDL instances, keyed by profile name
+    (e.g. 'peek', 'audio-m4a', 'audio-transcode:flac').
+
+    Building a YoutubeDL loads extractors, cookie jar and HTTP handlers, which
+    adds up over a big batch; borrowing an instance skips all of that. An
+    instance is only ever used by the thread that borrowed it.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _idle(self) -> dict:
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = {}
+        return idle
+
+    @contextmanager
+    def borrow(self, profile: str, params: dict, output_path: str = None, progress_hook=None):
+        """
+        Yields a YoutubeDL for `profile`, built from `params` the first time.
+        `params` must be the same for a given profile: only the output folder
+        (paths.home) and the progress hook change between borrows.
+        """
+        idle = self._idle()
+        # pop() so a nested borrow of the same profile gets its own instance
+        ydl = idle.pop(profile, None)
+        if ydl is None:
+            ydl = PooledYoutubeDL(params)
+
+        if output_path is not None:
+            ydl.params['paths'] = {'home': output_path}
+        ydl.current_progress_hook = progress_hook
+        try:
+            yield ydl
+        finally:
+            ydl.current_progress_hook = None
+            if profile in idle:
+                # Another instance came back first (nested borrow): drop this one
+                ydl.close()
+            else:
+                idle[profile] = ydl
+
+    def close_thread(self):
+        """Closes the instances cached for the calling thread."""
+        idle = self._idle()
+        for ydl in idle.values():
+            ydl.close()
+        idle.clear()
+
+
+# Shared by YouTubeDownloader and SoundCloudDownloader
+ydl_pool = YoutubeDLPool()
+
+
+def extract_and_download(ydl, query: str, output_path: str, playlist_folder: bool = True):
+    """
+    Fetches the page/API once (process=False), decides from that result
+    whether the URL is a playlist (-> subfolder named after it), then
+    downloads by processing the same result instead of extracting again.
+    Returns (info, output_path).
+    """
+    host = host_of(query)
+    with metrics.span('extract', host=host):
+        info = ydl.extract_info(query, download=False, process=False)
+    if not info:
+        raise yt_dlp.utils.DownloadError(f"No information found for {query}")
+
+    if playlist_folder and info.get('_type') == 'playlist':
+        pl_title = info.get('title') or 'Unknown Playlist'
+        print(f"Playlist detected: '{pl_title}'. Creating subfolder.")
+        output_path = os.path.join(output_path, sanitize_folder_name(pl_title))
+
+    os.makedirs(output_path, exist_ok=True)
+    ydl.params['paths'] = {'home': output_path}
+    with metrics.span('download', host=host):
+        return ydl.process_ie_result(info, download=True), output_path
+
+
+def downloaded_files(info: dict) -> list:
+    """
+    Final paths of the files a download produced (every entry of a playlist),
+    as recorded by yt-dlp and updated by the post-processors.
+    """
+    if not info:
+        return []
+    if info.get('_type') == 'playlist':
+        return [path for entry in info.get('entries') or [] for path in downloaded_files(entry)]
+    return [d['filepath'] for d in info.get('requested_downloads') or [] if d.get('filepath')]
+
+
+def remove_thumbnails(info: dict):
+    """Deletes the thumbnail files yt-dlp wrote and nothing consumed (EmbedThumbnail removes its own)."""
+    with metrics.span('thumbnails'):
+        _remove_thumbnails(info)
+
+
+def _remove_thumbnails(info: dict):
+    if not info:
+        return
+    if info.get('_type') == 'playlist':
+        for entry in info.get('entries') or []:
+            _remove_thumbnails(entry)
+        return
+    for thumbnail in info.get('thumbnails') or []:
+        path = thumbnail.get('filepath')
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                print(f"Cleaned up thumbnail: {path}")
+            except OSError as e:
+                print(f"Warning: could not remove thumbnail {path}: {e}")
+
+
+def source_id_for_url(url: str):
+    """
+    'Youtube:<video id>' for a single-video YouTube URL, worked out from the
+    URL alone (no network). None for anything else (playlists, SoundCloud,
+    whose ids need an API call).
+    """
+    from yt_dlp.extractor import get_info_extractor
+    ie = get_info_extractor('Youtube')
+    if ie.suitable(url):
+        video_id = ie.get_temp_id(url)
+        if video_id:
+            return f"Youtube:{video_id}"
+    return None
+
+
+def source_id(info: dict):
+    """Stable id of a downloaded entry, e.g. 'Youtube:dQw4w9WgXcQ' or 'Soundcloud:123'."""
+    if not info or info.get('_type') == 'playlist' or not info.get('id'):
+        return None
+    return f"{info.get('extractor_key') or info.get('ie_key')}:{info['id']}"
+
+
+class SearchCancelled(Exception):
+    """Raised by search_first when `cancelled` was set before the request was sent."""
+    pass
+
+
+def search_first(search_query: str, cancelled: threading.Event = None):
+    """
+    Runs a search such as 'scsearch1:artist - title' without downloading and
+    returns {'url', 'source_id'} of the first hit, or None when there is none.
+    Network errors are raised, so callers can tell them apart from "no result".
+    `cancelled` is checked once the rate limiter lets the search through.
+    """
+    with rate_limits.slot(search_query):
+        if cancelled is not None and cancelled.is_set():
+            raise SearchCancelled(search_query)
+        with ydl_pool.borrow('search', {'quiet': True, 'no_warnings': True}) as ydl, \
+                metrics.span('search', host=host_of(search_query)):
+            info = ydl.extract_info(search_query, download=False, process=False)
+            for entry in (info or {}).get('entries') or []:
+                if not entry:
+                    continue
+                url = entry.get('webpage_url') or entry.get('url')
+                if not url:
+                    continue
+                ie_key = entry.get('ie_key') or entry.get('extractor_key')
+                return {
+                    'url': url,
+                    'source_id': f"{ie_key}:{entry['id']}" if ie_key and entry.get('id') else None
+                }
+    return None
@@ -2,7 +2,14 @@ import os
 import sys
 import threading
 import time
-from web.app import app
+import urllib.request
+from web.app import app, manager, resume_jobs
+from web.server import serve
+
+READY_URL = 'http://127.0.0.1:5000/ready'
+READY_TIMEOUT = 15 # Seconds before opening the UI anyway
+# Local requests: never through a proxy configured in the environment
+_local_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
 
 # Kivy Imports through jnius/android
 try:
@@ -13,7 +20,28 @@ except ImportError:
     ANDROID = False
 
 def start_flask():
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    resume_jobs()
+    # waitress when available (MARTO_SERVER / MARTO_THREADS to override)
+    serve(app, host='0.0.0.0', port=5000)
+
+def wait_until_ready(url: str = READY_URL, timeout: float = READY_TIMEOUT, interval: float = 0.05) -> bool:
+    """Polls the server's /ready endpoint; True once it answers, False after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with _local_opener.open(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return True
+        except OSError:
+            pass # Not listening yet
+        time.sleep(interval)
+    print(f"Warning: server not ready after {timeout}s, opening the UI anyway.")
+    return False
+
+def warm_up():
+    # Backends are imported lazily; load them once the page is up so the
+    # first download doesn't pay for it
+    threading.Thread(target=manager.warm_up, daemon=True).start()
 
 def start_android_webview():
     if not ANDROID:
@@ -27,7 +55,7 @@ def start_android_webview():
     ])
     
     # Wait for server to start
-    time.sleep(2)
+    wait_until_ready()
     
     # Open URL in default browser (Chrome) which gives PWA experience
     PythonActivity = autoclass('org.kivy.android.PythonActivity')
@@ -37,6 +65,7 @@ def start_android_webview():
     intent = Intent(Intent.ACTION_VIEW)
     intent.setData(Uri.parse('http://localhost:5000'))
     PythonActivity.mActivity.startActivity(intent)
+    warm_up()
 
 if __name__ == '__main__':
     # Start Flask in thread
@@ -52,7 +81,8 @@ if __name__ == '__main__':
     else:
         # Desktop mode (testing)
         import webbrowser
-        time.sleep(1.5)
+        wait_until_ready()
         webbrowser.open('http://127.0.0.1:5000')
+        warm_up()
         while True:
             time.sleep(1)
\ No newline at end of file
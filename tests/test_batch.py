@@ -0,0 +1,84 @@
+"""
+run_batch: one report per query list, resumed by running the same list again.
+
+    python -m unittest tests.test_batch
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.batch import completed_queries, report_path_for, run_batch
+
+
+class FakeManager:
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.queries = []
+
+    def process(self, query, **options):
+        self.queries.append(query)
+        if query in self.failing:
+            return {"status": "error", "message": "No results found"}
+        return {"status": "success", "title": query, "files": [f"{query}.flac"]}
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.output = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_batch(self, manager, queries, **options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run_batch(manager, queries, output_path=self.output, workers=2, **options)
+
+    def test_same_list_resumes(self):
+        first = self.run_batch(FakeManager(failing=["b"]), ["a", "b", "c", "a"])
+        self.assertEqual((first['success'], first['failed'], first['skipped']), (2, 1, 1))
+        self.assertEqual(completed_queries(first['report']), {"a", "c"})
+
+        manager = FakeManager()
+        again = self.run_batch(manager, ["a", "b", "c", "a"])
+        self.assertEqual(again['report'], first['report'])
+        self.assertEqual(manager.queries, ["b"])
+
+    def test_other_lists_and_formats_get_their_own_report(self):
+        first = self.run_batch(FakeManager(), ["a", "b"])
+        manager = FakeManager()
+        other = self.run_batch(manager, ["a", "c"])
+        self.assertNotEqual(other['report'], first['report'])
+        self.assertEqual(sorted(manager.queries), ["a", "c"])
+
+        manager = FakeManager()
+        mp3 = self.run_batch(manager, ["a", "b"], format="mp3")
+        self.assertNotEqual(mp3['report'], first['report'])
+        self.assertEqual(sorted(manager.queries), ["a", "b"])
+
+    def test_stream_gets_a_new_report_every_run(self):
+        first = self.run_batch(FakeManager(), iter(["a", "b"]))
+        manager = FakeManager()
+        second = self.run_batch(manager, iter(["a", "b"]))
+        self.assertNotEqual(second['report'], first['report'])
+        self.assertEqual(sorted(manager.queries), ["a", "b"])
+        # ...unless its report is given
+        manager = FakeManager()
+        self.run_batch(manager, iter(["a", "b", "c"]), report_path=first['report'])
+        self.assertEqual(manager.queries, ["c"])
+
+    def test_report_path_for(self):
+        self.assertEqual(report_path_for(self.output, ["a", "b"]), report_path_for(self.output, ("a", "b")))
+        self.assertNotEqual(report_path_for(self.output, ["a", "b"]), report_path_for(self.output, ["b", "a"]))
+        self.assertTrue(os.path.basename(report_path_for(self.output, ["a"])).startswith("batch_report-"))
+
+
+if __name__ == '__main__':
+    unittest.main()
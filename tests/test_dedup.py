@@ -0,0 +1,152 @@
+"""
+DownloadCache: lookup / remember, and materialize never writing over a
+file that is already there.
+
+    python -m unittest tests.test_dedup
+"""
+import errno
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.dedup import DownloadCache, link_or_copy
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class DownloadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.root = self.tmp.name
+        self.cache = DownloadCache(os.path.join(self.root, 'downloads.db'))
+
+    def tearDown(self):
+        self.cache._db.close()
+        self.tmp.cleanup()
+
+    def folder(self, name):
+        return os.path.join(self.root, name)
+
+    def test_remember_then_lookup(self):
+        path = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        self.cache.remember('Youtube:x', 'm4a', path, title="Intro", query_key="sc+yt:intro")
+        self.assertEqual(self.cache.source_for_query("sc+yt:intro"), 'Youtube:x')
+        found = self.cache.lookup('Youtube:x', 'm4a')
+        self.assertEqual(found['path'], os.path.abspath(path))
+        self.assertEqual(found['title'], "Intro")
+        self.assertIsNone(self.cache.lookup('Youtube:x', 'flac'))
+
+    def test_lookup_drops_changed_files(self):
+        path = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        self.cache.remember('Youtube:x', 'm4a', path)
+        write(path, b'x' * 50)
+        self.assertIsNone(self.cache.lookup('Youtube:x', 'm4a'))
+        os.remove(path)
+        self.cache.remember('Youtube:x', 'm4a', write(path, b'x'))
+        os.remove(path)
+        self.assertIsNone(self.cache.lookup('Youtube:x', 'm4a'))
+
+    def test_materialize_links_into_other_folder(self):
+        path = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        self.cache.remember('Youtube:x', 'm4a', path)
+        dst, method = self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('B'))
+        self.assertEqual(dst, os.path.join(self.folder('B'), 'Intro.m4a'))
+        self.assertIn(method, ("hardlink", "reflink", "copy"))
+        self.assertEqual(read(dst), b'x' * 100)
+        # Again: the file is already there
+        self.assertEqual(self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('B')), (dst, "existing"))
+
+    def test_materialize_in_its_own_folder(self):
+        path = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        self.cache.remember('Youtube:x', 'm4a', path)
+        self.assertEqual(self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('A')),
+                         (os.path.abspath(path), "existing"))
+
+    def test_same_name_other_song_is_left_alone(self):
+        # X "Intro" reused (hardlinked) from A into B, then Y, also "Intro", into B
+        x = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        y = write(os.path.join(self.folder('C'), 'Intro.m4a'), b'y' * 100)
+        self.cache.remember('Youtube:x', 'm4a', x)
+        self.cache.remember('Youtube:y', 'm4a', y)
+        x_in_b, _ = self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('B'))
+        y_in_b, _ = self.cache.materialize(self.cache.lookup('Youtube:y', 'm4a'), self.folder('B'))
+
+        self.assertEqual(y_in_b, os.path.join(self.folder('B'), 'Intro (2).m4a'))
+        self.assertEqual(read(y_in_b), b'y' * 100)
+        self.assertEqual(read(x_in_b), b'x' * 100)
+        self.assertEqual(read(x), b'x' * 100)
+        # Each song finds its own file next time
+        self.assertEqual(self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('B')), (x_in_b, "existing"))
+        self.assertEqual(self.cache.materialize(self.cache.lookup('Youtube:y', 'm4a'), self.folder('B')), (y_in_b, "existing"))
+
+    def test_same_name_same_size_other_content(self):
+        x = write(os.path.join(self.folder('A'), 'Intro.m4a'), b'x' * 100)
+        other = write(os.path.join(self.folder('B'), 'Intro.m4a'), b'z' * 100)
+        self.cache.remember('Youtube:x', 'm4a', x)
+        dst, _ = self.cache.materialize(self.cache.lookup('Youtube:x', 'm4a'), self.folder('B'))
+        self.assertNotEqual(dst, other)
+        self.assertEqual(read(other), b'z' * 100)
+
+
+class LinkOrCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.src = write(os.path.join(self.tmp.name, 'src.m4a'), b'a' * 1000)
+        self.dst = os.path.join(self.tmp.name, 'dst.m4a')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hardlink(self):
+        self.assertEqual(link_or_copy(self.src, self.dst), "hardlink")
+        self.assertTrue(os.path.samefile(self.src, self.dst))
+
+    def test_without_hardlinks(self):
+        # Other filesystem: reflink where supported, else a copy; no temp file left
+        with mock.patch('os.link', side_effect=OSError(errno.EXDEV, "cross-device link")):
+            method = link_or_copy(self.src, self.dst)
+        self.assertIn(method, ("reflink", "copy"))
+        self.assertFalse(os.path.samefile(self.src, self.dst))
+        self.assertEqual(read(self.dst), b'a' * 1000)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['dst.m4a', 'src.m4a'])
+
+    @unittest.skipIf(sys.platform == 'win32', "no fcntl")
+    def test_plain_copy(self):
+        with mock.patch('os.link', side_effect=OSError(errno.EPERM, "no links")), \
+                mock.patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, "no reflink")):
+            self.assertEqual(link_or_copy(self.src, self.dst), "copy")
+        self.assertEqual(read(self.dst), b'a' * 1000)
+
+    def test_existing_dst_is_never_written(self):
+        write(self.dst, b'b' * 10)
+        with self.assertRaises(FileExistsError):
+            link_or_copy(self.src, self.dst)
+        self.assertEqual(read(self.dst), b'b' * 10)
+
+    def test_existing_dst_is_never_written_without_hardlinks(self):
+        write(self.dst, b'b' * 10)
+        with mock.patch('os.link', side_effect=OSError(errno.EXDEV, "cross-device link")):
+            with self.assertRaises(FileExistsError):
+                link_or_copy(self.src, self.dst)
+        self.assertEqual(read(self.dst), b'b' * 10)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['dst.m4a', 'src.m4a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
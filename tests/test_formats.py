@@ -0,0 +1,66 @@
+"""
+Format negotiation: keep / remux / keep-lossy / transcode decisions and
+the yt-dlp format strings.
+
+    python -m unittest tests.test_formats
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.formats import format_selector, negotiate, source_codec
+
+
+class NegotiateTest(unittest.TestCase):
+
+    def action(self, target, acodec=None, ext=None, **options):
+        return negotiate(target, acodec, ext, **options)['action']
+
+    def test_source_codec(self):
+        self.assertEqual(source_codec('mp4a.40.2', 'm4a'), 'aac')
+        self.assertEqual(source_codec('OPUS', 'webm'), 'opus')
+        self.assertEqual(source_codec('none', 'mp3'), 'mp3')
+        self.assertEqual(source_codec(None, 'ogg'), 'vorbis')
+        self.assertIsNone(source_codec(None, 'webm'))
+
+    def test_keep(self):
+        decision = negotiate('mp3', 'mp3', 'mp3')
+        self.assertEqual(decision['action'], 'keep')
+        self.assertIsNone(decision['preferredcodec'])
+        self.assertEqual(self.action('m4a', 'mp4a.40.2', 'm4a'), 'keep')
+
+    def test_remux(self):
+        decision = negotiate('opus', 'opus', 'webm')
+        self.assertEqual(decision['action'], 'remux')
+        self.assertEqual(decision['preferredcodec'], 'opus')
+        self.assertEqual(self.action('aac', 'mp4a.40.2', 'm4a'), 'remux')
+
+    def test_keep_lossy(self):
+        decision = negotiate('flac', 'opus', 'webm')
+        self.assertEqual(decision['action'], 'keep-lossy')
+        self.assertEqual(decision['preferredcodec'], 'best')
+        self.assertEqual(self.action('alac', 'mp3', 'mp3'), 'keep-lossy')
+        # Asked for raw PCM, or keep_lossy turned off: encoded anyway
+        self.assertEqual(self.action('wav', 'opus', 'webm'), 'transcode')
+        self.assertEqual(self.action('flac', 'opus', 'webm', keep_lossy=False), 'transcode')
+
+    def test_transcode(self):
+        decision = negotiate('mp3', 'opus', 'webm')
+        self.assertEqual(decision['action'], 'transcode')
+        self.assertEqual(decision['preferredcodec'], 'mp3')
+        self.assertEqual(self.action('flac', 'pcm_s16le', 'wav'), 'transcode')
+        # Unknown source: transcoding is the only safe choice
+        self.assertEqual(self.action('flac', None, 'webm'), 'transcode')
+
+    def test_format_selector(self):
+        self.assertEqual(format_selector('mp3'), 'bestaudio[ext=mp3]/bestaudio[acodec^=mp3]/bestaudio/best')
+        self.assertEqual(format_selector('m4a'), 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best')
+        self.assertEqual(format_selector('flac'),
+                         'bestaudio[ext=flac]/bestaudio[acodec^=flac]/bestaudio[acodec^=alac]/bestaudio[acodec^=pcm]/bestaudio/best')
+        self.assertEqual(format_selector('unknown'), 'bestaudio/best')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+JobQueue + JobJournal: jobs left unfinished are resumed without their
+finished tracks, and given up after MAX_RESUME_ATTEMPTS interrupted runs.
+
+    python -m unittest tests.test_jobs
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.jobs import Job, JobQueue, MAX_RESUME_ATTEMPTS
+from downloader.journal import JobJournal
+
+
+class FakeManager:
+    """Records the calls to process() and answers success."""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def process(self, query, output_path=".", progress_hook=None, on_track=None, finished_tracks=None, **options):
+        with self.lock:
+            self.calls.append({'query': query, 'finished_tracks': finished_tracks, 'options': options})
+        return {"status": "success", "title": query, "files": []}
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.db_path = os.path.join(self.tmp.name, 'jobs.db')
+        self.journal = JobJournal(self.db_path)
+        self.manager = FakeManager()
+        self.queue = None
+
+    def tearDown(self):
+        if self.queue is not None:
+            self.queue.shutdown()
+        self.journal._db.close()
+        self.tmp.cleanup()
+
+    def interrupted_job(self, query, starts=1, **options):
+        """A job journaled as if the process died while running it `starts` times."""
+        job = Job(query, self.tmp.name, options)
+        self.journal.add(job)
+        for _ in range(starts):
+            self.journal.start(job.id)
+        return job
+
+    def resume(self):
+        self.queue = JobQueue(self.manager, journal=self.journal)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumed = self.queue.resume_unfinished()
+        self.queue.shutdown() # Waits for the resumed jobs
+        return resumed
+
+    def test_resumed_job_skips_finished_tracks(self):
+        job = self.interrupted_job("https://open.spotify.com/playlist/x", format="mp3")
+        done = {'query': "Artist - One", 'status': "success", 'files': ["One.mp3"]}
+        self.journal.track_done(job.id, done['query'], done)
+        self.journal.track_done(job.id, "Artist - Two", {'query': "Artist - Two", 'status': "error"})
+
+        resumed = self.resume()
+        self.assertEqual([j.id for j in resumed], [job.id])
+        self.assertEqual(len(self.manager.calls), 1)
+        call = self.manager.calls[0]
+        self.assertEqual(call['query'], job.query)
+        self.assertEqual(call['options'], {'format': "mp3"})
+        self.assertEqual(call['finished_tracks'], {"Artist - One": done})
+
+        # Finished: nothing left to resume, no track rows kept
+        self.assertEqual(self.queue.get(job.id).state, "success")
+        self.assertEqual(self.journal.unfinished(), [])
+        self.assertEqual(self.journal.finished_tracks(job.id), {})
+
+    def test_queued_job_is_resumed(self):
+        job = self.interrupted_job("some song", starts=0)
+        self.assertEqual([j.id for j in self.resume()], [job.id])
+        self.assertEqual(self.queue.get(job.id).state, "success")
+
+    def test_gives_up_after_max_attempts(self):
+        retried = self.interrupted_job("almost", starts=MAX_RESUME_ATTEMPTS - 1)
+        crashing = self.interrupted_job("crashes every time", starts=MAX_RESUME_ATTEMPTS)
+
+        resumed = self.resume()
+        self.assertEqual([j.id for j in resumed], [retried.id])
+        self.assertEqual([c['query'] for c in self.manager.calls], ["almost"])
+
+        given_up = self.queue.get(crashing.id)
+        self.assertEqual(given_up.state, "error")
+        self.assertIn(f"{MAX_RESUME_ATTEMPTS} interrupted attempts", given_up.result['message'])
+        self.assertEqual(self.journal.unfinished(), [])
+
+    def test_attempts_survive_a_restart(self):
+        job = self.interrupted_job("song", starts=MAX_RESUME_ATTEMPTS - 1)
+        self.journal._db.close()
+        self.journal = JobJournal(self.db_path)
+        self.assertEqual(self.journal.unfinished()[0]['attempts'], MAX_RESUME_ATTEMPTS - 1)
+        self.assertEqual(self.journal.start(job.id), MAX_RESUME_ATTEMPTS)
+
+    def test_journal_without_attempts_column(self):
+        # Journal written before attempts were counted
+        self.journal._db.close()
+        os.remove(self.db_path)
+        db = sqlite3.connect(self.db_path)
+        db.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, query TEXT NOT NULL, "
+                   "output_path TEXT NOT NULL, options TEXT NOT NULL, payload TEXT, state TEXT NOT NULL, "
+                   "created_at REAL NOT NULL, finished_at REAL, result TEXT)")
+        db.execute("INSERT INTO jobs VALUES ('old', 'download', 'song', '.', '{}', NULL, 'running', 1, NULL, NULL)")
+        db.commit()
+        db.close()
+
+        self.journal = JobJournal(self.db_path)
+        self.assertEqual(self.journal.unfinished()[0]['attempts'], 0)
+        self.assertEqual(self.journal.start('old'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+LibraryIndex: keyset pagination, ETags and the added date.
+
+    python -m unittest tests.test_library
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web.library import LibraryIndex
+
+# filename -> tags (read_tags is replaced: the test files are not real audio)
+TAGS = {
+    'a.mp3': {'title': "Intro", 'artist': "Zed", 'album': "One"},
+    'b.mp3': {'title': "Intro", 'artist': "Ann", 'album': "Two"},
+    'c.mp3': {'title': "Outro", 'artist': "Ann", 'album': "Two"},
+    'd.flac': {'title': "Middle", 'artist': "Bob"},
+    'e.m4a': {},
+}
+
+
+class LibraryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.root = os.path.join(self.tmp.name, 'library')
+        for i, name in enumerate(sorted(TAGS)):
+            self.write(os.path.join('Album' if i % 2 else '', name), mtime=1000 + i)
+        patcher = mock.patch('web.library.read_tags', side_effect=lambda path: dict(TAGS.get(os.path.basename(path), {})))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = LibraryIndex(os.path.join(self.tmp.name, 'library.db'), tag_workers=2)
+        self.sync()
+
+    def tearDown(self):
+        self.index._db.close()
+        self.tmp.cleanup()
+
+    def write(self, rel_path, mtime=None):
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 10)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def sync(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.index.sync(self.root)
+
+    def all_pages(self, limit, **options):
+        paths, cursor = [], None
+        while True:
+            page = self.index.page(self.root, cursor=cursor, limit=limit, **options)
+            self.assertLessEqual(len(page['tracks']), limit)
+            paths += [t['path'] for t in page['tracks']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return paths, page['total']
+
+    def test_pages_match_one_query(self):
+        for sort in ('folder', 'title', 'artist', 'album', 'added'):
+            for descending in (False, True):
+                whole = self.index.page(self.root, sort=sort, descending=descending, limit=100)
+                self.assertIsNone(whole['next_cursor'])
+                for limit in (1, 2, 3):
+                    paths, total = self.all_pages(limit, sort=sort, descending=descending)
+                    self.assertEqual(paths, [t['path'] for t in whole['tracks']], (sort, descending, limit))
+                    self.assertEqual(total, len(TAGS))
+
+    def test_equal_titles_are_ordered_by_path(self):
+        paths, _ = self.all_pages(1, sort='title')
+        self.assertEqual(paths[:2], ['Album/b.mp3', 'a.mp3'])
+
+    def test_search_and_filters(self):
+        self.assertEqual(self.all_pages(1, search="intro")[0], ['Album/b.mp3', 'a.mp3'])
+        self.assertEqual(self.all_pages(1, search="in", prefix=True)[0], ['Album/b.mp3', 'a.mp3'])
+        self.assertEqual(self.all_pages(2, sort='title', artist="Ann")[0], ['Album/b.mp3', 'c.mp3'])
+        self.assertEqual(self.index.page(self.root, search="100%")['total'], 0)
+
+    def test_cursor_is_validated(self):
+        for cursor in ("not a cursor", self.index._encode_cursor(["Intro"])):
+            with self.assertRaises(ValueError):
+                self.index.page(self.root, sort='title', cursor=cursor)
+        with self.assertRaises(ValueError):
+            self.index.page(self.root, sort='size')
+
+    def test_etag(self):
+        tag = self.index.etag(self.root, 'folder', False, None)
+        self.assertEqual(tag, self.index.etag(self.root, 'folder', False, None))
+        self.assertNotEqual(tag, self.index.etag(self.root, 'title', False, None))
+        # Nothing changed on disk: same tag after a sync
+        self.sync()
+        self.assertEqual(tag, self.index.etag(self.root, 'folder', False, None))
+        self.index.add_file(self.root, self.write('new.mp3'))
+        self.assertNotEqual(tag, self.index.etag(self.root, 'folder', False, None))
+
+    def test_added_date(self):
+        # First index of a root: dated by mtime
+        first = self.index.page(self.root, sort='added', limit=100)['tracks']
+        self.assertEqual([t['added_at'] for t in first], sorted(1000 + i for i in range(len(TAGS))))
+
+        # Files arriving later are dated when indexed, whatever their mtime
+        before = time.time()
+        self.write('Album/synced.mp3', mtime=500)
+        self.sync()
+        added = self.index.add_file(self.root, self.write('added.mp3', mtime=600))
+        self.assertGreaterEqual(added['added_at'], before)
+        newest = self.index.page(self.root, sort='added', descending=True, limit=2)['tracks']
+        self.assertEqual(sorted(t['path'] for t in newest), ['Album/synced.mp3', 'added.mp3'])
+
+        # A changed file keeps its date
+        self.write('a.mp3', mtime=5000)
+        self.sync()
+        self.assertEqual(self.index.page(self.root, search="Zed")['tracks'][0]['added_at'], 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
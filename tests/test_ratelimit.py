@@ -0,0 +1,153 @@
+"""
+HostLimiter: AIMD concurrency, Retry-After pauses, and the host lookup of
+RateLimits.
+
+    python -m unittest tests.test_ratelimit
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.ratelimit import HostLimiter, RateLimits, host_of, load_rate_limits, throttle_status
+
+
+def answer(limiter, status=None, retry_after=None):
+    """One request through the limiter, answered with `status`."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        with limiter.slot() as slot:
+            if status is not None:
+                slot.report(status, retry_after)
+
+
+class HostLimiterTest(unittest.TestCase):
+
+    def test_throttling_halves_then_recovers(self):
+        limiter = HostLimiter('example.com', max_concurrency=8, cooldown=0)
+        answer(limiter, 429)
+        self.assertEqual(limiter.limit, 4)
+        answer(limiter, 403)
+        self.assertEqual(limiter.limit, 2)
+        # One more parallel request per `limit` healthy answers in a row
+        answer(limiter, 200)
+        self.assertEqual(limiter.limit, 2)
+        answer(limiter, 200)
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(3):
+            answer(limiter)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_bounds(self):
+        limiter = HostLimiter('example.com', min_concurrency=2, max_concurrency=3, cooldown=0)
+        for _ in range(5):
+            answer(limiter, 429)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(20):
+            answer(limiter, 200)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_rate_backs_off_and_recovers(self):
+        limiter = HostLimiter('example.com', rate=100, burst=100, max_concurrency=1, cooldown=0)
+        answer(limiter, 429)
+        self.assertEqual(limiter.bucket.rate, 50)
+        answer(limiter, 200)
+        self.assertEqual(limiter.bucket.rate, 60)
+        for _ in range(10):
+            answer(limiter, 200)
+        self.assertEqual(limiter.bucket.rate, 100)
+
+    def test_errors_and_slow_answers_do_not_count_as_healthy(self):
+        limiter = HostLimiter('example.com', max_concurrency=4, initial_concurrency=1, target_latency=0.05)
+        answer(limiter, 500)
+        self.assertEqual(limiter.limit, 1)
+        with limiter.slot():
+            time.sleep(0.1)
+        self.assertEqual(limiter.limit, 1)
+        answer(limiter, 200)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_exception_mentioning_429_is_throttling(self):
+        limiter = HostLimiter('example.com', max_concurrency=4, cooldown=0)
+        with self.assertRaises(RuntimeError), contextlib.redirect_stdout(io.StringIO()):
+            with limiter.slot():
+                raise RuntimeError("ERROR: unable to download: HTTP Error 429: Too Many Requests")
+        self.assertEqual(limiter.limit, 2)
+
+    def test_retry_after_pauses_the_host(self):
+        limiter = HostLimiter('example.com', max_concurrency=4, cooldown=30)
+        answer(limiter, 429, retry_after="0.3")
+        start = time.monotonic()
+        answer(limiter)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_403_without_retry_after_does_not_pause(self):
+        limiter = HostLimiter('example.com', cooldown=30)
+        answer(limiter, 403)
+        start = time.monotonic()
+        answer(limiter)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_concurrency_is_limited(self):
+        limiter = HostLimiter('example.com', max_concurrency=2)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def request():
+            with limiter.slot():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=request) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+class RateLimitsTest(unittest.TestCase):
+
+    def test_host_of(self):
+        self.assertEqual(host_of('ytsearch1:some song'), 'youtube.com')
+        self.assertEqual(host_of('scsearch1:some song'), 'soundcloud.com')
+        self.assertEqual(host_of('https://youtu.be/abc'), 'youtube.com')
+        self.assertEqual(host_of('https://Open.Spotify.com/track/1'), 'open.spotify.com')
+
+    def test_throttle_status(self):
+        self.assertEqual(throttle_status(Exception("HTTP Error 403: Forbidden")), 403)
+        self.assertIsNone(throttle_status(Exception("HTTP Error 404: Not Found")))
+        self.assertIsNone(throttle_status(Exception("timed out")))
+
+    def test_for_host(self):
+        limits = RateLimits({'youtube.com': {'max_concurrency': 3}, '*': {'max_concurrency': 5}})
+        self.assertEqual(limits.for_host('www.youtube.com').host, 'youtube.com')
+        self.assertIs(limits.for_host('youtube.com'), limits.for_host('m.youtube.com'))
+        self.assertEqual(limits.for_host('notyoutube.com').host, '*')
+        limits.configure({'youtube.com': {'rate': 1}})
+        limiter = limits.for_host('youtube.com')
+        self.assertEqual((limiter.max_concurrency, limiter.max_rate), (3, 1))
+
+    def test_load_rate_limits(self):
+        with tempfile.TemporaryDirectory(prefix="marto-test-") as tmp:
+            path = os.path.join(tmp, 'rate_limits.json')
+            self.assertIn('youtube.com', load_rate_limits(path))
+            with open(path, 'w', encoding="utf-8") as f:
+                json.dump({'youtube.com': {'rate': 0.5}, 'example.com': {'rate': 1}}, f)
+            settings = load_rate_limits(path)
+            self.assertEqual(settings['youtube.com']['rate'], 0.5)
+            self.assertEqual(settings['youtube.com']['max_concurrency'], 4)
+            self.assertEqual(settings['example.com'], {'rate': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
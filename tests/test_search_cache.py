@@ -0,0 +1,88 @@
+"""
+SearchCache: LRU eviction, TTLs (shorter for "no result") and the JSON file.
+
+    python -m unittest tests.test_search_cache
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.search_cache import SearchCache
+
+HIT = {'url': 'https://soundcloud.com/a/b', 'source_id': 'Soundcloud:1'}
+
+
+class SearchCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.path = os.path.join(self.tmp.name, 'search_cache.json')
+        self.now = 1000000.0
+        patcher = mock.patch('downloader.search_cache.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cache(self, **options):
+        # save_interval=0: every change is written right away, no timer thread
+        options.setdefault('save_interval', 0)
+        return SearchCache(self.path, **options)
+
+    def test_miss_hit_and_negative_entry(self):
+        cache = self.cache()
+        self.assertEqual(cache.get('sc:a'), (False, None))
+        cache.set('sc:a', HIT)
+        cache.set('sc:b', None)
+        self.assertEqual(cache.get('sc:a'), (True, HIT))
+        self.assertEqual(cache.get('sc:b'), (True, None))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = self.cache(max_entries=2)
+        cache.set('sc:a', HIT)
+        cache.set('sc:b', HIT)
+        cache.get('sc:a') # b is now the least recently used
+        cache.set('sc:c', HIT)
+        self.assertEqual(cache.get('sc:b'), (False, None))
+        self.assertEqual(cache.get('sc:a'), (True, HIT))
+        self.assertEqual(cache.get('sc:c'), (True, HIT))
+
+    def test_ttls(self):
+        cache = self.cache(ttl=100, negative_ttl=10)
+        cache.set('sc:hit', HIT)
+        cache.set('sc:none', None)
+        self.now += 9
+        self.assertEqual(cache.get('sc:none'), (True, None))
+        self.now += 1
+        self.assertEqual(cache.get('sc:none'), (False, None))
+        self.assertEqual(cache.get('sc:hit'), (True, HIT))
+        self.now += 90
+        self.assertEqual(cache.get('sc:hit'), (False, None))
+
+    def test_saved_and_reloaded(self):
+        cache = self.cache(negative_ttl=10)
+        cache.set('sc:a', HIT)
+        cache.set('sc:b', None)
+        self.now += 20
+        cache.set('yt:c', HIT) # saves; the expired negative entry is left out
+        with open(self.path, encoding="utf-8") as f:
+            self.assertNotIn('sc:b', f.read())
+
+        reloaded = self.cache()
+        self.assertEqual(reloaded.get('sc:a'), (True, HIT))
+        self.assertEqual(reloaded.get('yt:c'), (True, HIT))
+        self.assertEqual(reloaded.get('sc:b'), (False, None))
+
+    def test_unreadable_file_starts_empty(self):
+        with open(self.path, 'w', encoding="utf-8") as f:
+            f.write("{not json")
+        self.assertEqual(self.cache().get('sc:a'), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+/stream/<file>: Range (seeking) and conditional requests.
+
+    python -m unittest tests.test_stream
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app opens its databases (jobs, library index, download cache) at
+# import: keep them out of the checkout's config folder
+CONFIG_DIR = tempfile.mkdtemp(prefix="marto-test-config-")
+os.environ['MARTO_CONFIG_DIR'] = CONFIG_DIR
+
+from web.app import app, output_folder
+
+
+def tearDownModule():
+    shutil.rmtree(CONFIG_DIR, ignore_errors=True)
+
+SIZE = 1000
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="marto-test-")
+        self.data = bytes(i % 251 for i in range(SIZE))
+        with open(os.path.join(self.tmp.name, 'track.mp3'), 'wb') as f:
+            f.write(self.data)
+        self.previous_folder = output_folder.get()
+        output_folder.set(self.tmp.name)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        output_folder.set(self.previous_folder)
+        self.tmp.cleanup()
+
+    def get(self, path, **headers):
+        resp = self.client.get(path, headers=headers)
+        # Reads the body and closes the file send_file opened
+        resp.get_data()
+        resp.close()
+        return resp
+
+    def test_whole_file(self):
+        resp = self.get('/stream/track.mp3')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(resp.mimetype, 'audio/mpeg')
+        self.assertEqual(resp.data, self.data)
+
+    def test_range(self):
+        resp = self.get('/stream/track.mp3', Range='bytes=0-99')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers['Content-Range'], f'bytes 0-99/{SIZE}')
+        self.assertEqual(resp.headers['Content-Length'], '100')
+        self.assertEqual(resp.data, self.data[:100])
+
+    def test_range_in_the_middle(self):
+        resp = self.get('/stream/track.mp3', Range='bytes=500-')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers['Content-Range'], f'bytes 500-{SIZE - 1}/{SIZE}')
+        self.assertEqual(resp.data, self.data[500:])
+
+    def test_unsatisfiable_range(self):
+        resp = self.get('/stream/track.mp3', Range='bytes=5000-')
+        self.assertEqual(resp.status_code, 416)
+
+    def test_if_none_match(self):
+        etag = self.get('/stream/track.mp3').headers['ETag']
+        resp = self.get('/stream/track.mp3', **{'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+
+    def test_missing_file(self):
+        self.assertEqual(self.get('/stream/missing.mp3').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import json
 import sys
 import os
+import threading
 
 # Add parent dir to path to import downloader.manager
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from downloader.manager import DownloaderManager
+from downloader.jobs import JobQueue, QueueFullError
+from downloader.batch import read_queries
+from downloader.journal import JobJournal
+from downloader.events import EventBus
+from downloader.config import get_config_dir
+from downloader.metrics import metrics
 
 app = Flask(__name__)
 
@@ -25,26 +33,65 @@ else:
 
 manager = DownloaderManager()
 
-try:
-    import tkinter as tk
-    from tkinter import filedialog
-    TK_AVAILABLE = True
-except ImportError:
-    TK_AVAILABLE = False
-import threading
+# Downloads run in the background; /download only enqueues and returns a job id
+MAX_DOWNLOAD_WORKERS = 2
+# Job, progress and library events, pushed to the UI over /events
+events = EventBus()
+# MARTO_TRACE=1 saves the timing spans of every job (config/traces, /jobs/<id>/trace)
+TRACE_DIR = str(get_config_dir('traces')) if os.environ.get('MARTO_TRACE') == '1' else None
+# Jobs and finished tracks are journaled so a restart (crash, Android
+# killing the app) continues them instead of starting over
+jobs = JobQueue(manager, max_workers=MAX_DOWNLOAD_WORKERS, journal=JobJournal(str(get_config_dir() / 'jobs.db')), events=events,
+                trace_dir=TRACE_DIR)
+_resume_lock = threading.Lock()
+_jobs_resumed = False
+
+def resume_jobs():
+    """Restarts the jobs left unfinished by the previous run (once per process)."""
+    global _jobs_resumed
+    with _resume_lock:
+        if _jobs_resumed:
+            return
+        _jobs_resumed = True
+    jobs.resume_unfinished()
+
+class OutputFolder:
+    """
+    Output folder selected in the UI, shared by every request thread (and the
+    download listeners). Requests read it once and use that value throughout.
+    """
 
-# Global to store current selection (in a real app per-session, but local tool global is fine)
-current_output_dir = DEFAULT_OUTPUT_DIR
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            return self._path
+
+    def set(self, path: str):
+        with self._lock:
+            self._path = path
+
+# Current selection (in a real app per-session, but local tool global is fine)
+output_folder = OutputFolder(DEFAULT_OUTPUT_DIR)
+
+@app.route('/ready')
+def ready():
+    """Answers as soon as the server is up (main.py waits for it before opening the UI)."""
+    return jsonify({"status": "ready", "backends_loaded": manager.backends_loaded})
 
 @app.route('/')
 def index():
-    return render_template('index.html', current_path=current_output_dir)
+    return render_template('index.html', current_path=output_folder.get())
 
 @app.route('/select_folder', methods=['POST'])
 def select_folder():
-    global current_output_dir
-    
-    if not TK_AVAILABLE:
+    # Imported here: only the desktop dialog needs it, and not at startup
+    try:
+        import tkinter as tk
+        from tkinter import filedialog
+    except ImportError:
         return jsonify({"status": "error", "message": "Folder selection not supported on Android"}), 501
 
     # Tkinter needs to run in main thread usually, or at least be handled carefully.
@@ -57,16 +104,17 @@ def select_folder():
         root.destroy()
         
         if folder_selected:
-            current_output_dir = folder_selected
-            return jsonify({"status": "success", "path": current_output_dir})
+            output_folder.set(folder_selected)
+            return jsonify({"status": "success", "path": folder_selected})
         else:
-            return jsonify({"status": "cancelled", "path": current_output_dir})
+            return jsonify({"status": "cancelled", "path": output_folder.get()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/open_folder', methods=['POST'])
 def open_folder():
     try:
+        current_output_dir = output_folder.get()
         print(f"Opening folder: {current_output_dir}")
         if not os.path.exists(current_output_dir):
             os.makedirs(current_output_dir)
@@ -128,38 +176,208 @@ def download():
         print(f"Random selection: {query}")
 
     try:
-        # Use valid current_output_dir
-        result = manager.process(query, output_path=current_output_dir, no_cover=no_cover, format=format)
-        return jsonify(result)
-        
+        # Use the output folder selected at submit time
+        job = jobs.submit(query, output_path=output_folder.get(), no_cover=no_cover, format=format)
+        return jsonify({"status": "queued", "job_id": job.id, "query": query}), 202
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-        
+
+MAX_BATCH_WORKERS = 8
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Queues many queries/URLs as one job.
+    JSON body: {"queries": [...]} or {"text": "one query per line"},
+    plus optional format, no_cover, workers. Progress is written to a
+    batch_report-<key>.jsonl of this list in the output folder;
+    resubmitting the same list skips what already succeeded.
+    """
+    data = request.json or {}
+    queries = data.get('queries')
+    if queries is None:
+        queries = list(read_queries((data.get('text') or '').splitlines()))
+    else:
+        queries = list(read_queries(str(q) for q in queries))
+
+    if not queries:
+        return jsonify({"status": "error", "message": "No queries provided"}), 400
+
+    try:
+        workers = min(max(int(data.get('workers', 4)), 1), MAX_BATCH_WORKERS)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Invalid workers"}), 400
+
+    try:
+        job = jobs.submit_batch(queries, output_path=output_folder.get(), workers=workers,
+                                no_cover=data.get('no_cover', False), format=data.get('format', 'flac'))
+        return jsonify({"status": "queued", "job_id": job.id, "count": len(queries)}), 202
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/jobs')
+def list_jobs():
+    """Returns all known download jobs (most recent last)"""
+    return jsonify({"status": "success", "jobs": [job.to_dict() for job in jobs.list()]})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Returns state, per-track progress and result of one job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+@app.route('/jobs/<job_id>/trace')
+def get_job_trace(job_id):
+    """Timing spans of one job (so far, if it is still running). Needs MARTO_TRACE=1."""
+    job = jobs.get(job_id)
+    if job is not None and job.trace is not None:
+        return jsonify({"status": "success", "trace": job.trace.to_dict()})
+    path = jobs.trace_path(job_id)
+    if path is None:
+        message = "No trace for this job" if TRACE_DIR else "Tracing is off (set MARTO_TRACE=1)"
+        return jsonify({"status": "error", "message": message}), 404
+    with open(path, 'r', encoding="utf-8") as f:
+        return jsonify({"status": "success", "trace": json.load(f)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Counters and stage timings in the Prometheus text format."""
+    states = {"queued": 0, "running": 0, "success": 0, "error": 0}
+    for job in jobs.list():
+        states[job.state] = states.get(job.state, 0) + 1
+    for state, count in states.items():
+        metrics.set_gauge('marto_jobs', count, help="Jobs known to the queue, by state", state=state)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Seconds between SSE comments on an idle stream (keeps proxies from closing it)
+EVENTS_KEEPALIVE = 15
+
+@app.route('/events')
+def event_stream():
+    """
+    Server-Sent Events stream: 'job' (state changes), 'progress' (track
+    progress) and 'library' (file added) events, as they happen. Browsers
+    reconnect by themselves and send Last-Event-ID to get what they missed.
+    """
+    subscription = events.subscribe(request.headers.get('Last-Event-ID', type=int))
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                item = subscription.get(timeout=EVENTS_KEEPALIVE)
+                if item is None:
+                    yield ": keepalive\n\n" # Also notices clients that went away
+                    continue
+                event_id, event, data = item
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # --- PLAYER / LIBRARY ROUTES ---
 try:
     import library
 except ImportError:
     from web import library
 from flask import send_from_directory
+from werkzeug.exceptions import HTTPException
+
+# SQLite catalog of the library: synced incrementally, fed by finished downloads
+library_index = library.LibraryIndex(str(get_config_dir() / 'library.db'))
+
+def index_downloaded_file(path):
+    # Index the new file and tell open pages, they append it without reloading
+    root = output_folder.get()
+    track = library_index.add_file(root, path)
+    if track:
+        events.publish('library', {'root': root, 'track': track})
+
+manager.add_file_listener(index_downloaded_file)
+
+LIBRARY_PAGE_SIZE = 200
+LIBRARY_MAX_PAGE_SIZE = 1000
 
 @app.route('/api/library')
 def get_library():
-    """Returns the list of downloaded music"""
+    """
+    Returns one page of downloaded music.
+    Query args: limit, cursor (from next_cursor), sort=folder|title|artist|album|added,
+    order=asc|desc, q=search text, match=prefix, artist=, album= (exact),
+    refresh=1 (rescan folder first).
+    Supports If-None-Match: unchanged pages answer 304.
+    """
     try:
-        current_path = current_output_dir
-        tracks = library.scan_library(current_path)
-        return jsonify({"status": "success", "tracks": tracks, "root": current_path})
+        current_path = output_folder.get()
+        if request.args.get('refresh'):
+            library_index.sync(current_path)
+        else:
+            library_index.ensure_synced(current_path)
+
+        sort = request.args.get('sort', 'folder')
+        descending = request.args.get('order', 'asc') == 'desc'
+        search = request.args.get('q', '').strip() or None
+        prefix = request.args.get('match') == 'prefix'
+        cursor = request.args.get('cursor') or None
+        artist = request.args.get('artist')
+        album = request.args.get('album')
+        try:
+            limit = min(max(int(request.args.get('limit', LIBRARY_PAGE_SIZE)), 1), LIBRARY_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid limit"}), 400
+
+        etag = library_index.etag(current_path, sort, descending, search, prefix, cursor, limit, artist, album)
+        if etag in request.if_none_match:
+            return '', 304, {'ETag': f'"{etag}"'}
+
+        try:
+            page = library_index.page(current_path, sort=sort, descending=descending, search=search,
+                                      prefix=prefix, cursor=cursor, limit=limit, artist=artist, album=album)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        response = jsonify({
+            "status": "success",
+            "tracks": page['tracks'],
+            "next_cursor": page['next_cursor'],
+            "total": page['total'],
+            "root": current_path
+        })
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Streaming: send_file answers Range requests with 206 (seeking), and
+# If-None-Match / If-Modified-Since with 304. The bytes are still read by
+# Python: Range answers go through Werkzeug's _RangeWrapper, never sendfile().
+# Behind nginx/Apache, MARTO_X_SENDFILE=1 lets the front server send the
+# bytes itself (X-Sendfile), Python then never reads the file.
+app.config['USE_X_SENDFILE'] = os.environ.get('MARTO_X_SENDFILE') == '1'
+STREAM_MAX_AGE = 3600
+
 @app.route('/stream/<path:filename>')
 def stream_music(filename):
-    """Streams an audio file from the current output dir"""
+    """Streams an audio file from the current output dir (supports Range/seeking)"""
     try:
-        return send_from_directory(current_output_dir, filename)
+        ext = os.path.splitext(filename)[1].lower()
+        return send_from_directory(
+            output_folder.get(), filename,
+            mimetype=library.AUDIO_MIMETYPES.get(ext),
+            conditional=True,
+            etag=True,
+            max_age=STREAM_MAX_AGE
+        )
+    except HTTPException:
+        raise # 404 missing file, 416 unsatisfiable Range: keep the proper status
     except Exception as e:
         print(f"Stream error: {e}")
         return str(e), 404
@@ -168,10 +386,26 @@ def stream_music(filename):
 def download_music_file(filename):
     """Forces download of the file"""
     try:
-        return send_from_directory(current_output_dir, filename, as_attachment=True)
+        return send_from_directory(output_folder.get(), filename, as_attachment=True)
     except Exception as e:
         return str(e), 404
 
 if __name__ == '__main__':
+    import argparse
+    try:
+        from server import serve, SERVER_MODES
+    except ImportError:
+        from web.server import serve, SERVER_MODES
+
+    parser = argparse.ArgumentParser(description="Marto web UI")
+    parser.add_argument('--server', choices=SERVER_MODES, default=None, help="WSGI server (default: MARTO_SERVER or auto)")
+    parser.add_argument('--threads', type=int, default=None, help="request threads (waitress)")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--debug', action='store_true', help="development server with reloader")
+    args = parser.parse_args()
+
+    # With the debug reloader, only the child process (the one serving) resumes jobs
+    if not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_jobs()
     # host='0.0.0.0' is crucial for mobile access
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    serve(app, host='0.0.0.0', port=args.port, mode=args.server, threads=args.threads, debug=args.debug)
@@ -1,7 +1,32 @@
 import os
 import json
+import base64
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.m4a', '.ogg')
+from downloader.metrics import metrics
+
+try:
+    import mutagen
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.m4a', '.ogg', '.opus')
+
+# Explicit types: the system mimetypes table varies (Windows registry, Android)
+# and browsers need the right one to seek inside a stream.
+AUDIO_MIMETYPES = {
+    '.mp3': 'audio/mpeg',
+    '.flac': 'audio/flac',
+    '.wav': 'audio/wav',
+    '.m4a': 'audio/mp4',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg', # Opus in an Ogg container (kept as is from SoundCloud)
+}
 
 def scan_library(root_path):
     """
@@ -40,3 +65,330 @@ def scan_library(root_path):
     # Sort by folder then filename
     library.sort(key=lambda x: (x['folder'], x['title']))
     return library
+
+
+def read_tags(full_path):
+    """
+    Reads title/artist/album from the file tags and duration/bitrate from the
+    stream info. Missing values are left out; returns {} if the file can't be parsed.
+    """
+    if not MUTAGEN_AVAILABLE:
+        return {}
+    try:
+        audio = mutagen.File(full_path, easy=True)
+    except Exception as e:
+        print(f"Warning: could not read tags of {full_path}: {e}")
+        return {}
+    if audio is None:
+        return {}
+
+    tags = {}
+    for key in ('title', 'artist', 'album'):
+        try:
+            values = audio.tags.get(key) if audio.tags else None
+        except Exception:
+            values = None
+        if values:
+            tags[key] = str(values[0]).strip()
+
+    info = getattr(audio, 'info', None)
+    if getattr(info, 'length', None):
+        tags['duration'] = round(info.length, 2)
+    if getattr(info, 'bitrate', None):
+        tags['bitrate'] = int(info.bitrate)
+    return tags
+
+
+# Bump when the table layout changes: the index is only a cache, it gets rebuilt.
+SCHEMA_VERSION = 2
+
+# sort name -> columns of the keyset (last one must be unique per root)
+SORT_KEYS = {
+    'folder': ('folder', 'title', 'path'),
+    'title': ('title', 'path'),
+    'artist': ('artist', 'album', 'title', 'path'),
+    'album': ('album', 'title', 'path'),
+    'added': ('added_at', 'path'),
+}
+
+TRACK_COLUMNS = "path, filename, title, artist, album, duration, bitrate, folder, added_at"
+
+class LibraryIndex:
+    """
+    Persistent SQLite catalog of the audio files under one or more roots.
+
+    sync() walks the folder but only writes rows whose mtime/size changed,
+    add_file() indexes a single new file (called when a download finishes),
+    and tracks() answers from the database without touching the disk.
+    Tags are only parsed for new or changed files (the mtime/size check),
+    on `tag_workers` threads during a sync.
+    """
+
+    def __init__(self, db_path: str, tag_workers: int = 4):
+        self.tag_workers = max(1, tag_workers)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = {}
+        # Bumped on every write for a root; with the per-process token it makes the ETag
+        self._generation = {}
+        self._token = f"{time.time():.6f}"
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS tracks")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL DEFAULT '',
+                    album TEXT NOT NULL DEFAULT '',
+                    duration REAL,
+                    bitrate INTEGER,
+                    folder TEXT NOT NULL,
+                    mtime REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (root, path)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS tracks_order ON tracks (root, folder, title)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (root, artist, album, title)")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.commit()
+
+    @staticmethod
+    def _row(root_path: str, full_path: str, st, tags: dict, added_at: float) -> tuple:
+        rel_path = os.path.relpath(full_path, root_path).replace('\\', '/') # Web friendly paths
+        file = os.path.basename(full_path)
+
+        # Folder from the path, the rest from tags (title falls back to the filename)
+        folder_name = os.path.basename(os.path.dirname(full_path))
+        if folder_name == os.path.basename(root_path):
+            folder_name = "Singles" # Root level files
+
+        return (root_path, rel_path, file, tags.get('title') or os.path.splitext(file)[0],
+                tags.get('artist', ''), tags.get('album', ''), tags.get('duration'), tags.get('bitrate'),
+                folder_name, st.st_mtime, st.st_size, added_at)
+
+    @staticmethod
+    def _walk(path: str):
+        """Yields (full_path, stat) for audio files, using scandir's cached dir entries."""
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from LibraryIndex._walk(entry.path)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+
+    def _upsert(self, rows: list):
+        # added_at is kept from the first time we saw the file (see _sync)
+        self._db.executemany("""
+            INSERT INTO tracks (root, path, filename, title, artist, album, duration, bitrate, folder, mtime, size, added_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(root, path) DO UPDATE SET
+                filename = excluded.filename, title = excluded.title, artist = excluded.artist,
+                album = excluded.album, duration = excluded.duration, bitrate = excluded.bitrate,
+                folder = excluded.folder, mtime = excluded.mtime, size = excluded.size
+        """, rows)
+
+    def sync(self, root_path: str) -> dict:
+        """
+        Brings the index for root_path in line with the disk.
+        Returns {'added_or_updated': n, 'removed': n}.
+        """
+        with metrics.span('library_scan'):
+            return self._sync(root_path)
+
+    def _sync(self, root_path: str) -> dict:
+        root_path = os.path.abspath(root_path)
+        with self._sync_lock:
+            with self._lock:
+                known = {
+                    row['path']: (row['mtime'], row['size'])
+                    for row in self._db.execute("SELECT path, mtime, size FROM tracks WHERE root = ?", (root_path,))
+                }
+
+            changed_files = []
+            seen = set()
+            if os.path.exists(root_path):
+                for full_path, st in self._walk(root_path):
+                    rel_path = os.path.relpath(full_path, root_path).replace('\\', '/')
+                    seen.add(rel_path)
+                    if known.get(rel_path) != (st.st_mtime, st.st_size):
+                        changed_files.append((full_path, st))
+            removed = [(root_path, path) for path in known.keys() - seen]
+
+            # New files are "added" now (the mtime is the upload date for yt-dlp
+            # files, the original's for dedup hardlinks), except when a root is
+            # indexed for the first time: then its files are only known by mtime.
+            seeding = not known
+            now = time.time()
+
+            # Only new/changed files get their tags parsed
+            def build_row(item):
+                full_path, st = item
+                return self._row(root_path, full_path, st, read_tags(full_path), st.st_mtime if seeding else now)
+
+            if len(changed_files) > 1 and self.tag_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.tag_workers, thread_name_prefix="marto-tags") as pool:
+                    changed = list(pool.map(build_row, changed_files))
+            else:
+                changed = [build_row(item) for item in changed_files]
+
+            with self._lock:
+                self._upsert(changed)
+                self._db.executemany("DELETE FROM tracks WHERE root = ? AND path = ?", removed)
+                self._db.commit()
+                if changed or removed:
+                    self._bump(root_path)
+            self._synced_at[root_path] = time.time()
+
+        if changed or removed:
+            print(f"Library index: {len(changed)} added/updated, {len(removed)} removed in {root_path}")
+        return {'added_or_updated': len(changed), 'removed': len(removed)}
+
+    def ensure_synced(self, root_path: str, max_age: float = 60):
+        """
+        Syncs synchronously the first time a root is seen, then at most every
+        max_age seconds in a background thread so requests never wait on the disk.
+        """
+        root_path = os.path.abspath(root_path)
+        synced_at = self._synced_at.get(root_path)
+        if synced_at is None:
+            self.sync(root_path)
+        elif time.time() - synced_at > max_age and not self._sync_lock.locked():
+            self._synced_at[root_path] = time.time() # Don't start several refreshes
+            threading.Thread(target=self.sync, args=(root_path,), daemon=True).start()
+
+    def add_file(self, root_path: str, full_path: str):
+        """
+        Indexes one file (e.g. just downloaded) and returns its track dict
+        (same fields as tracks()), or None if not audio or outside root_path.
+        """
+        root_path = os.path.abspath(root_path)
+        full_path = os.path.abspath(full_path)
+        if not full_path.lower().endswith(AUDIO_EXTENSIONS):
+            return None
+        try:
+            if os.path.commonpath([root_path, full_path]) != root_path:
+                return None
+            st = os.stat(full_path)
+        except (OSError, ValueError): # ValueError: different drives on Windows
+            return None
+        row = self._row(root_path, full_path, st, read_tags(full_path), time.time())
+        with self._lock:
+            self._upsert([row])
+            self._db.commit()
+            self._bump(root_path)
+            track = self._db.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE root = ? AND path = ?", (root_path, row[1])
+            ).fetchone()
+        return dict(track) if track else None
+
+    def _bump(self, root_path: str):
+        self._generation[root_path] = self._generation.get(root_path, 0) + 1
+
+    def etag(self, root_path: str, *params) -> str:
+        """
+        Changes whenever the tracks of root_path change (or the server restarts).
+        params (sort, search, cursor...) are mixed in so every page gets its own tag.
+        """
+        root_path = os.path.abspath(root_path)
+        key = json.dumps([self._token, root_path, self._generation.get(root_path, 0), params])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    def tracks(self, root_path: str) -> list:
+        """Like scan_library(root_path) plus tag fields, read from the index."""
+        root_path = os.path.abspath(root_path)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE root = ? ORDER BY folder, title",
+                (root_path,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def page(self, root_path: str, sort: str = 'folder', descending: bool = False,
+             search: str = None, prefix: bool = False, cursor: str = None, limit: int = 200,
+             artist: str = None, album: str = None) -> dict:
+        """
+        One page of tracks, using keyset (cursor) pagination so deep pages
+        cost the same as the first one.
+        sort: 'folder', 'title', 'artist', 'album' or 'added'.
+        search: substring of title/artist/album/folder/filename, or prefix of
+        the title when prefix=True. artist/album: exact match filters.
+        Returns {'tracks': [...], 'next_cursor': str or None, 'total': n}.
+        """
+        root_path = os.path.abspath(root_path)
+        columns = SORT_KEYS.get(sort)
+        if columns is None:
+            raise ValueError(f"Unknown sort '{sort}'")
+
+        where = ["root = ?"]
+        args = [root_path]
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            if prefix:
+                where.append("title LIKE ? ESCAPE '\\'")
+                args.append(escaped + '%')
+            else:
+                fields = ('title', 'artist', 'album', 'folder', 'filename')
+                where.append("(" + " OR ".join(f"{f} LIKE ? ESCAPE '\\'" for f in fields) + ")")
+                args += ['%' + escaped + '%'] * len(fields)
+        if artist is not None:
+            where.append("artist = ?")
+            args.append(artist)
+        if album is not None:
+            where.append("album = ?")
+            args.append(album)
+
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM tracks WHERE {' AND '.join(where)}", args).fetchone()[0]
+
+            if cursor:
+                after = self._decode_cursor(cursor, len(columns))
+                op = '<' if descending else '>'
+                where.append(f"({', '.join(columns)}) {op} ({', '.join('?' * len(columns))})")
+                args += after
+
+            direction = 'DESC' if descending else 'ASC'
+            order = ', '.join(f"{c} {direction}" for c in columns)
+            rows = self._db.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE {' AND '.join(where)} "
+                f"ORDER BY {order} LIMIT ?",
+                args + [limit + 1]
+            ).fetchall()
+
+        tracks = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = tracks[-1]
+            next_cursor = self._encode_cursor([last[c] for c in columns])
+        return {'tracks': tracks, 'next_cursor': next_cursor, 'total': total}
+
+    @staticmethod
+    def _encode_cursor(values: list) -> str:
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor: str, size: int) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, UnicodeError):
+            raise ValueError("Invalid cursor")
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("Invalid cursor")
+        return values
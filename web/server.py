@@ -0,0 +1,58 @@
+import os
+
+# Pure-Python production WSGI server, also packaged for Android (buildozer.spec)
+try:
+    import waitress
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+
+SERVER_MODES = ('auto', 'waitress', 'dev')
+
+# Defaults, overridable with MARTO_SERVER / MARTO_THREADS (e.g. on Android, no command line)
+# Every open /events stream (one per open page) holds one of the request
+# threads for as long as the page stays open: with N pages open, only
+# DEFAULT_THREADS - N are left for the player, library and API requests.
+DEFAULT_THREADS = 12
+KEEP_ALIVE_TIMEOUT = 120 # Seconds an idle keep-alive connection (player, polling) stays open
+
+
+def server_mode(mode: str = None) -> str:
+    """Resolves 'auto' (or MARTO_SERVER) to 'waitress' when installed, else 'dev'."""
+    mode = mode or os.environ.get('MARTO_SERVER', 'auto')
+    if mode not in SERVER_MODES:
+        raise ValueError(f"Unknown server mode {mode!r} (expected one of {', '.join(SERVER_MODES)})")
+    if mode == 'auto':
+        return 'waitress' if WAITRESS_AVAILABLE else 'dev'
+    if mode == 'waitress' and not WAITRESS_AVAILABLE:
+        print("Warning: waitress is not installed, using the development server.")
+        return 'dev'
+    return mode
+
+
+def serve(app, host: str = '0.0.0.0', port: int = 5000, mode: str = None, threads: int = None, debug: bool = False):
+    """
+    Serves `app` until the process stops.
+      waitress: production server, `threads` request threads, HTTP/1.1 keep-alive.
+      dev:      Werkzeug's server (threaded, keep-alive); debug=True adds the reloader.
+    Streaming and library requests keep their own threads while downloads run
+    in the JobQueue workers; each open /events stream holds one thread.
+    """
+    mode = 'dev' if debug else server_mode(mode)
+    threads = max(1, threads or int(os.environ.get('MARTO_THREADS', DEFAULT_THREADS)))
+
+    if mode == 'waitress':
+        print(f"Serving on http://{host}:{port} (waitress, {threads} threads)")
+        waitress.serve(
+            app,
+            host=host,
+            port=port,
+            threads=threads,
+            channel_timeout=KEEP_ALIVE_TIMEOUT,
+            ident="marto",
+        )
+        return
+
+    # threaded=True also makes Werkzeug speak HTTP/1.1 (keep-alive)
+    print(f"Serving on http://{host}:{port} (development server)")
+    app.run(host=host, port=port, debug=debug, threaded=True)
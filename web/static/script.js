@@ -69,9 +69,9 @@ document.getElementById('downloadForm').addEventListener('submit', async (e) =>
 
         const data = await response.json();
 
-        if (data.status === 'success') {
-            triggerLightning(); // Success flash
-            addLog(`MISSION ACCOMPLIE : ${data.title}`, 'success');
+        if (data.status === 'queued') {
+            addLog(`EN FILE D'ATTENTE : ${query} [JOB ${data.job_id}]`, 'info');
+            // Progress and result arrive on the /events stream
         } else {
             addLog(`ÉCHEC : ${data.message}`, 'error');
         }
@@ -91,6 +91,51 @@ document.getElementById('downloadForm').addEventListener('submit', async (e) =>
     }
 });
 
+// --- LIVE EVENTS ---
+// One Server-Sent Events connection pushes job states, track progress and
+// new library files: nothing is polled. EventSource reconnects by itself.
+const trackSteps = {}; // job + track -> last logged 25% step
+
+function connectEvents() {
+    const source = new EventSource('/events');
+
+    source.addEventListener('job', (e) => {
+        const job = JSON.parse(e.data);
+        if (job.state === 'running') {
+            addLog(`EN COURS : ${job.query}${job.resumed ? ' [REPRISE]' : ''}`, 'info');
+        } else if (job.state === 'success') {
+            triggerLightning(); // Success flash
+            addLog(`MISSION ACCOMPLIE : ${(job.result && job.result.title) || job.query}`, 'success');
+        } else if (job.state === 'error') {
+            addLog(`ÉCHEC : ${(job.result && job.result.message) || job.query}`, 'error');
+        }
+    });
+
+    source.addEventListener('progress', (e) => {
+        const data = JSON.parse(e.data);
+        const track = data.track;
+        const key = `${data.job_id}:${data.key}`;
+
+        // Log progress every 25% of each track
+        if (track.total_bytes && track.state === 'downloading') {
+            const pct = Math.floor((track.downloaded_bytes / track.total_bytes) * 4) * 25;
+            if (pct !== trackSteps[key] && pct < 100) {
+                trackSteps[key] = pct;
+                const eta = track.eta != null ? ` ETA ${track.eta}s` : '';
+                addLog(`${track.title || data.key} : ${pct}%${eta}`, 'info');
+            }
+        } else if (track.state === 'finished') {
+            delete trackSteps[key];
+        }
+    });
+
+    source.addEventListener('library', (e) => {
+        appendLibraryTrack(JSON.parse(e.data).track);
+    });
+}
+
+connectEvents();
+
 function addLog(msg, type) {
     const log = document.getElementById('log');
     const entry = document.createElement('div');
@@ -361,59 +406,150 @@ navBtns.forEach(btn => {
 let libraryLoaded = false;
 let playlist = [];
 let currentTrackIndex = -1;
+let libraryCursor = null; // next_cursor of the last page, null when everything is loaded
+let libraryLoading = false;
+let libraryRequest = null; // AbortController of the page being loaded
+let libraryRequestId = 0; // Only the answer to the latest request is shown
+const LIBRARY_PAGE_SIZE = 200;
 const libraryList = document.getElementById('libraryList');
 const refreshLibraryBtn = document.getElementById('refreshLibraryBtn');
+const librarySearch = document.getElementById('librarySearch');
+const librarySort = document.getElementById('librarySort');
+
+refreshLibraryBtn.addEventListener('click', () => fetchLibrary(true));
+librarySort.addEventListener('change', () => fetchLibrary());
 
-refreshLibraryBtn.addEventListener('click', fetchLibrary);
+// Search server-side, once the user stops typing
+let librarySearchTimer = null;
+librarySearch.addEventListener('input', () => {
+    clearTimeout(librarySearchTimer);
+    librarySearchTimer = setTimeout(() => fetchLibrary(), 300);
+});
 
-async function fetchLibrary() {
+function libraryUrl(cursor, refresh) {
+    // librarySort values look like "folder:asc" / "added:desc"
+    const [sort, order] = librarySort.value.split(':');
+    const params = new URLSearchParams({ sort: sort, order: order, limit: LIBRARY_PAGE_SIZE });
+    const q = librarySearch.value.trim();
+    if (q) params.set('q', q);
+    if (cursor) params.set('cursor', cursor);
+    if (refresh) params.set('refresh', '1'); // Rescan the folder before answering
+    return `/api/library?${params}`;
+}
+
+async function fetchLibrary(refresh = false) {
     libraryList.innerHTML = '<div class="loading">CHARGEMENT...</div>';
+    playlist = [];
+    libraryCursor = null;
+    await loadLibraryPage(null, refresh);
+}
+
+async function loadLibraryPage(cursor, refresh = false) {
+    // The next page waits for the current load; a new list (refresh, search,
+    // sort) replaces it, since its cursor no longer means anything
+    if (libraryLoading && cursor) return;
+    if (libraryRequest) libraryRequest.abort();
+    const controller = new AbortController();
+    const requestId = ++libraryRequestId;
+    libraryRequest = controller;
+    libraryLoading = true;
     try {
-        const res = await fetch('/api/library');
+        // The browser revalidates with If-None-Match, unchanged pages come back as 304
+        const res = await fetch(libraryUrl(cursor, refresh), { signal: controller.signal });
         const data = await res.json();
+        if (requestId !== libraryRequestId) return; // Answer to an older query
 
         if (data.status === 'success') {
-            renderLibrary(data.tracks);
-            playlist = data.tracks; // Simple playlist = all tracks
+            if (!cursor) libraryList.innerHTML = '';
+            renderLibrary(data.tracks, playlist.length);
+            playlist = playlist.concat(data.tracks); // Simple playlist = loaded tracks
+            libraryCursor = data.next_cursor;
             libraryLoaded = true;
+            if (playlist.length === 0) {
+                libraryList.innerHTML = '<div style="text-align:center;color:#666;">AUCUN SON TROUVÉ</div>';
+            }
         } else {
-            libraryList.innerHTML = `<div class="log-entry error">ERREUR: ${data.message}</div>`;
+            showLibraryError(`ERREUR: ${data.message}`);
         }
     } catch (e) {
-        libraryList.innerHTML = `<div class="log-entry error">ERREUR RESEAU</div>`;
+        if (requestId !== libraryRequestId) return; // Aborted by a newer query
+        showLibraryError('ERREUR RESEAU');
+    } finally {
+        if (requestId === libraryRequestId) {
+            libraryLoading = false;
+            libraryRequest = null;
+        }
     }
 }
 
-function renderLibrary(tracks) {
-    libraryList.innerHTML = '';
-    if (tracks.length === 0) {
-        libraryList.innerHTML = '<div style="text-align:center;color:#666;">AUCUN SON TROUVÉ</div>';
-        return;
+// Load the next page when the user scrolls near the bottom
+window.addEventListener('scroll', () => {
+    if (!libraryCursor || libraryLoading || !views['library-view'].classList.contains('active')) return;
+    if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 400) {
+        loadLibraryPage(libraryCursor);
     }
+});
+
+// Adds a just downloaded track at the end of the loaded list (the next load
+// sorts it in). Only when the whole, unfiltered list is shown: otherwise it
+// comes with the next page or search, the server index already has it.
+function appendLibraryTrack(track) {
+    if (!libraryLoaded || libraryLoading || libraryCursor || librarySearch.value.trim()) return;
+    if (playlist.some(t => t.path === track.path)) return;
+    if (playlist.length === 0) libraryList.innerHTML = ''; // "AUCUN SON TROUVÉ"
+    renderLibrary([track], playlist.length);
+    playlist.push(track);
+}
+
+function textDiv(className, text) {
+    const div = document.createElement('div');
+    div.className = className;
+    div.textContent = text;
+    return div;
+}
+
+function actionButton(label, onClick) {
+    const button = document.createElement('button');
+    button.className = 'action-btn';
+    button.textContent = label;
+    button.addEventListener('click', onClick);
+    return button;
+}
+
+function showLibraryError(message) {
+    libraryList.innerHTML = '';
+    libraryList.appendChild(textDiv('log-entry error', message)); // message may echo server data
+}
 
-    let currentFolder = '';
+function renderLibrary(tracks, offset) {
+    const fragment = document.createDocumentFragment();
 
-    tracks.forEach((track, index) => {
-        // Group by folder? Maybe simple list is better for now
+    tracks.forEach((track, i) => {
+        const index = offset + i;
         const el = document.createElement('div');
         el.className = 'track-item';
 
         // Format title
         let displayTitle = track.title;
-        let displayMeta = track.folder === 'Singles' ? '' : track.folder;
-
-        el.innerHTML = `
-            <div class="track-info" onclick="playTrack(${index})">
-                <div class="track-title">${displayTitle}</div>
-                <div class="track-meta">${displayMeta}</div>
-            </div>
-            <div class="track-actions">
-                <button class="action-btn" onclick="playTrack(${index})">▶</button>
-                <button class="action-btn" onclick="saveToPhone('${track.path.replace(/'/g, "\\'")}')">💾</button>
-            </div>
-        `;
-        libraryList.appendChild(el);
+        let folder = track.folder === 'Singles' ? '' : track.folder;
+        let displayMeta = [track.artist, track.album || folder].filter(Boolean).join(' — ');
+
+        // Titles and tags come from the uploaders: set as text, never as HTML
+        const info = document.createElement('div');
+        info.className = 'track-info';
+        info.addEventListener('click', () => playTrack(index));
+        info.appendChild(textDiv('track-title', displayTitle));
+        info.appendChild(textDiv('track-meta', displayMeta));
+
+        const actions = document.createElement('div');
+        actions.className = 'track-actions';
+        actions.appendChild(actionButton('▶', () => playTrack(index)));
+        actions.appendChild(actionButton('💾', () => saveToPhone(track.path)));
+
+        el.append(info, actions);
+        fragment.appendChild(el);
     });
+    libraryList.appendChild(fragment);
 }
 
 // AUDIO PLAYER
@@ -434,7 +570,7 @@ window.playTrack = function (index) {
 
     // Update Player UI
     playerTitle.textContent = track.title;
-    playerArtist.textContent = track.folder; // Using folder as artist substitute
+    playerArtist.textContent = track.artist || track.folder; // Folder when the file has no tags
     playerBar.classList.remove('hidden');
 
     // Play